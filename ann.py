@@ -0,0 +1,269 @@
+"""Optional approximate nearest-neighbour (IVF) index over LSA vectors.
+
+Exact scoring is one sparse product against every title. For very large
+catalogs (typically built with --neighbours-k 0) this index narrows each
+query to a few clusters first:
+
+- TF-IDF rows are reduced with TruncatedSVD to a dense float32 space
+- k-means centroids in that space split the catalog into inverted lists
+- a query probes its `probes` closest lists, and only those candidates are
+  re-scored with the exact sparse cosine
+
+More probes means higher recall and slower queries. Build it into an
+existing artifact and pick `probes` from the recall@10 table:
+
+    python ann.py build [movies.csv] [artifact_dir] [--components 128] [--lists 0]
+    python ann.py evaluate [movies.csv] [artifact_dir] [--probes 1 2 4 8 16] [--queries 500]
+
+Serving uses it when RECOMMENDER_ANN_PROBES is set to a positive number.
+
+The index is keyed on the `artifact_id` it was built for. `build` gives the
+artifact a new id so running workers reload and pick the index up, and
+every later publish (artifact.py, catalog_updates.py) carries it over: when
+the feature space is unchanged only the rows are re-assigned to the
+existing lists, otherwise it is refitted with the same settings.
+"""
+import argparse
+import filecmp
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+from artifact import ARTIFACT_DIR, artifact_version, load_artifact, republish
+from instrumentation import latency_summary
+from similarity import SimilarityEngine
+
+ANN_DIR = 'ann'  # Inside the artifact directory
+ANN_PROBES = int(os.environ.get('RECOMMENDER_ANN_PROBES', '0'))
+FIT_SAMPLE = 100_000
+
+
+class AnnIndex:
+    """IVF lists over SVD-reduced vectors, with exact re-scoring of the probed candidates."""
+
+    def __init__(self, matrix, components, centroids, list_offsets, list_rows, probes=8):
+        self.matrix = matrix  # The engine's L2-normalized CSR matrix, used for exact re-scoring
+        self.components = components  # (terms, dims) projection into the reduced space
+        self.centroids = centroids  # (lists, dims), unit length
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.probes = probes
+
+    def candidates(self, query, probes=None):
+        """Rows in the `probes` lists whose centroids are closest to a sparse (1, terms) query."""
+        probes = min(probes or self.probes, len(self.centroids))
+        reduced = np.asarray(query @ self.components).ravel()
+        centroid_scores = self.centroids @ reduced
+        lists = np.argpartition(-centroid_scores, probes - 1)[:probes]
+        return np.concatenate([self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists])
+
+    def search(self, query, k=10, exclude=(), probes=None):
+        """Approximate top-k (row, score) for a unit-length sparse query, best first."""
+        rows = self.candidates(query, probes)
+        if len(exclude):
+            rows = rows[~np.isin(rows, list(exclude))]
+        if not len(rows):
+            return []
+        scores = (self.matrix[rows] @ query.T).toarray().ravel()
+        top = min(k, len(rows))
+        best = np.argpartition(-scores, top - 1)[:top]
+        order = np.lexsort((rows[best], -scores[best]))
+        return [(int(rows[best[i]]), float(scores[best[i]])) for i in order]
+
+
+def fit_ann(similarity, components=128, lists=0, seed=0, batch_size=65536, probes=8):
+    """Fit SVD + k-means on the engine's matrix and return the in-memory AnnIndex."""
+    matrix = similarity.matrix
+    n, terms = matrix.shape
+    components = max(1, min(components, terms - 1))
+    lists = lists or max(1, int(np.sqrt(n)))  # sqrt(N) lists keeps both probe stages cheap
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n, min(n, FIT_SAMPLE), replace=False))
+
+    svd = TruncatedSVD(n_components=components, random_state=seed)
+    svd.fit(matrix[sample])
+    projection = svd.components_.T.astype(np.float32)
+
+    kmeans = MiniBatchKMeans(n_clusters=min(lists, len(sample)), random_state=seed, n_init=3,
+                             batch_size=min(4096, len(sample)))
+    kmeans.fit(normalize(matrix[sample] @ projection))
+    centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+    list_offsets, list_rows = _assign_lists(matrix, projection, centroids, batch_size)
+    return AnnIndex(matrix, projection, centroids, list_offsets, list_rows, probes)
+
+
+def build_ann(similarity, artifact_dir, components=128, lists=0, seed=0, batch_size=65536):
+    """Fit the index on the engine's matrix, write it under artifact_dir/ann and republish the artifact."""
+    ann = fit_ann(similarity, components, lists, seed, batch_size)
+    artifact_id = uuid.uuid4().hex
+    manifest = _save_ann(ann, artifact_dir, artifact_id, seed)
+    republish(artifact_dir, artifact_id)  # Workers see a new artifact_id and reload with the index
+    return manifest
+
+
+def carry_over_ann(old_dir, new_dir, artifact_manifest, batch_size=65536):
+    """Give an artifact about to be published the index `old_dir` has, or return None if it has none."""
+    try:
+        with open(os.path.join(old_dir, ANN_DIR, 'manifest.json')) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return None
+    matrix = _load_matrix(new_dir, artifact_manifest['shape'])
+    if _same_features(old_dir, new_dir):
+        # Same vocabulary, idf and weights (a catalog delta): keep the projection and lists, re-assign rows
+        components = np.load(os.path.join(old_dir, ANN_DIR, 'components.npy'))
+        centroids = np.load(os.path.join(old_dir, ANN_DIR, 'centroids.npy'))
+        list_offsets, list_rows = _assign_lists(matrix, components, centroids, batch_size)
+        ann = AnnIndex(matrix, components, centroids, list_offsets, list_rows)
+    else:
+        ann = fit_ann(SimilarityEngine(matrix, normalized=True), previous['components'], previous['lists'],
+                      previous.get('seed', 0), batch_size)
+    return _save_ann(ann, new_dir, artifact_manifest['artifact_id'], previous.get('seed', 0))
+
+
+def _assign_lists(matrix, projection, centroids, batch_size):
+    # Assign every row to its closest centroid, one batch at a time
+    assignment = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], batch_size):
+        reduced = normalize(matrix[start:start + batch_size] @ projection)
+        assignment[start:start + batch_size] = np.argmax(reduced @ centroids.T, axis=1)
+    list_rows = np.argsort(assignment, kind='stable').astype(np.int32)
+    list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=list_offsets[1:])
+    return list_offsets, list_rows
+
+
+def _save_ann(ann, artifact_dir, artifact_id, seed):
+    n, terms = ann.matrix.shape
+    manifest = {'artifact_id': artifact_id, 'rows': n, 'terms': terms, 'components': int(ann.components.shape[1]),
+                'lists': len(ann.centroids), 'seed': seed}
+    target = os.path.join(artifact_dir, ANN_DIR)
+    tmp_dir = tempfile.mkdtemp(prefix='.ann-', dir=artifact_dir)
+    np.save(os.path.join(tmp_dir, 'components.npy'), ann.components)
+    np.save(os.path.join(tmp_dir, 'centroids.npy'), ann.centroids)
+    np.save(os.path.join(tmp_dir, 'list_offsets.npy'), ann.list_offsets)
+    np.save(os.path.join(tmp_dir, 'list_rows.npy'), ann.list_rows)
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.rename(tmp_dir, target)
+    return manifest
+
+
+def load_ann(artifact_dir, similarity, probes=8, artifact_id=None):
+    """Open the index memory-mapped, or return None if it is missing or built for another artifact.
+
+    `artifact_id` is the id of the artifact `similarity` was loaded from (default: the published one).
+    """
+    directory = os.path.join(artifact_dir, ANN_DIR)
+    manifest = _read_ann_manifest(directory)
+    if artifact_id is None:
+        artifact_id = artifact_version(artifact_dir)
+    if manifest is None or manifest.get('artifact_id') != artifact_id or manifest['rows'] != len(similarity):
+        return None
+
+    def load(name):
+        return np.load(os.path.join(directory, name), mmap_mode='r')
+
+    ann = AnnIndex(similarity.matrix, load('components.npy'), load('centroids.npy'),
+                   load('list_offsets.npy'), load('list_rows.npy'), probes)
+    # A publish while the files were opened may have swapped some of them
+    if (_read_ann_manifest(directory) or {}).get('artifact_id') != artifact_id:
+        return None
+    return ann
+
+
+def evaluate(similarity, ann, probes=(1, 2, 4, 8, 16), queries=500, k=10, seed=0):
+    """recall@k against exact results, candidate counts and latency for each probes setting."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(similarity), min(queries, len(similarity)), replace=False)
+    k = max(1, min(k, len(similarity) - 1))  # Each query excludes itself
+
+    exact_samples = []
+    thresholds = []  # k-th best exact score per query; ties at that score all count as hits
+    for row in rows:
+        start = time.perf_counter()
+        scores = similarity.scores(row)
+        scores[row] = -np.inf
+        thresholds.append(np.partition(scores, len(scores) - k)[len(scores) - k])
+        exact_samples.append(time.perf_counter() - start)
+
+    report = {'queries': len(rows), 'k': k, 'exact': latency_summary(exact_samples), 'probes': {}}
+    for setting in probes:
+        samples, hits, candidates = [], 0, 0
+        for row, threshold in zip(rows, thresholds):
+            query = similarity.matrix[row]
+            start = time.perf_counter()
+            found = ann.search(query, k, exclude=[row], probes=setting)
+            samples.append(time.perf_counter() - start)
+            hits += min(k, sum(score >= threshold - 1e-6 for _, score in found))
+            candidates += len(ann.candidates(query, setting))
+        report['probes'][str(setting)] = {
+            f'recall@{k}': round(hits / (k * len(rows)), 4),
+            'mean_candidates': round(candidates / len(rows), 1),
+            **latency_summary(samples),
+        }
+    return report
+
+
+def _read_ann_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _load_matrix(artifact_dir, shape):
+    def load(name):
+        return np.load(os.path.join(artifact_dir, name), mmap_mode='r')
+
+    return csr_matrix((load('data.npy'), load('indices.npy'), load('indptr.npy')), shape=tuple(shape), copy=False)
+
+
+def _same_features(old_dir, new_dir):
+    try:
+        return all(filecmp.cmp(os.path.join(old_dir, name), os.path.join(new_dir, name), shallow=False)
+                   for name in ('features.json', 'idf.npy', 'vocabulary.json'))
+    except OSError:
+        return False  # An older or partial artifact: refit rather than guess
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or evaluate the approximate nearest-neighbour index.')
+    parser.add_argument('command', choices=['build', 'evaluate'])
+    parser.add_argument('csv', nargs='?', default='movies.csv')
+    parser.add_argument('artifact_dir', nargs='?', default=ARTIFACT_DIR)
+    parser.add_argument('--components', type=int, default=128)
+    parser.add_argument('--lists', type=int, default=0, help='number of inverted lists (default sqrt(rows))')
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    artifact = load_artifact(args.artifact_dir, args.csv)
+    if artifact is None:
+        parser.error(f'{args.artifact_dir} is missing or stale; run python artifact.py first')
+    similarity = artifact['similarity']
+    if args.command == 'build':
+        manifest = build_ann(similarity, args.artifact_dir, args.components, args.lists)
+        print(f"Wrote {os.path.join(args.artifact_dir, ANN_DIR)}: {manifest['lists']} lists, "
+              f"{manifest['components']} components")
+    else:
+        ann = load_ann(args.artifact_dir, similarity, artifact_id=artifact['manifest']['artifact_id'])
+        if ann is None:
+            parser.error('no ANN index for this artifact; run python ann.py build first')
+        print(json.dumps(evaluate(similarity, ann, args.probes, args.queries), indent=2))
+
+
+if __name__ == '__main__':
+    main()
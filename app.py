@@ -1,15 +1,21 @@
 import streamlit as st
 import pandas as pd
-import difflib
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import requests
 import random
-import time
+import os
+from artifact import ARTIFACT_DIR, artifact_version
+from instrumentation import log_trace, metrics, span, start_trace
+from poster_cache import GRID_4_WIDTH, GRID_5_WIDTH, static_url
+from recommender import load_recommender
+from service import RemoteRecommender
+from tmdb import PLACEHOLDER_POSTER, fetch_as_completed, fetch_movie_details
 
 # Set page config (MUST BE THE FIRST STREAMLIT COMMAND)
 st.set_page_config(page_title="Movie Recommender", layout="wide")
 
+# Timing spans and counters for this rerun; shown in the sidebar with RECOMMENDER_DEBUG=1 or ?debug=1
+trace = start_trace("rerun")
+DEBUG_PANEL = os.environ.get('RECOMMENDER_DEBUG') == '1' or st.query_params.get('debug') == '1'
+
 # Initialize session state for favorites, recommendations, and current page
 if 'favorites' not in st.session_state:
     st.session_state.favorites = []
@@ -21,98 +27,74 @@ if 'selected_movie' not in st.session_state:
     st.session_state.selected_movie = None
 if 'filtered_movies' not in st.session_state:
     st.session_state.filtered_movies = []
+if 'notice' not in st.session_state:
+    st.session_state.notice = None
 
 # Load dataset
-@st.cache_data  # Cache the dataset for faster loading
-def load_data():
-    movies_data = pd.read_csv('movies.csv')
-    selected_features = ['genres', 'keywords', 'tagline', 'cast', 'director']
-    for feature in selected_features:
-        movies_data[feature] = movies_data[feature].fillna('')
-    movies_data['combined_features'] = (
-        movies_data['genres'] + ' ' +
-        movies_data['keywords'] + ' ' +
-        movies_data['tagline'] + ' ' +
-        movies_data['cast'] + ' ' +
-        movies_data['director']
-    )
-    vectorizer = TfidfVectorizer()
-    feature_vectors = vectorizer.fit_transform(movies_data['combined_features'])
-    similarity = cosine_similarity(feature_vectors)
-    return movies_data, similarity
-
-movies_data, similarity = load_data()
-
-# Fetch movie poster, director, trailer, and rating using TMDB API
-def fetch_movie_details(title, movies_data):
-    TMDB_API_KEY = '711e04f6f9c64b4b56a9fdd452624371'  # Your TMDB API key
-    base_url = 'https://api.themoviedb.org/3'
-    
-    try:
-        # Step 1: Search for the movie
-        search_url = f'{base_url}/search/movie?api_key={TMDB_API_KEY}&query={title}'
-        search_response = requests.get(search_url)
-        search_response.raise_for_status()  # Raise an error for bad responses
-        search_data = search_response.json()
-        
-        if search_data['results']:
-            movie_id = search_data['results'][0]['id']
-            
-            # Step 2: Fetch movie details
-            details_url = f'{base_url}/movie/{movie_id}?api_key={TMDB_API_KEY}'
-            details_response = requests.get(details_url)
-            details_response.raise_for_status()
-            details_data = details_response.json()
-            
-            # Step 3: Fetch movie poster
-            poster_path = details_data.get('poster_path', '')
-            poster_url = f"https://image.tmdb.org/t/p/w500{poster_path}" if poster_path else "https://via.placeholder.com/500x750?text=No+Poster+Available"
-            
-            # Step 4: Fetch director from CSV instead of API
-            movie_row = movies_data[movies_data['title'].str.lower() == title.lower()]  # Match title case-insensitively
-            director = movie_row['director'].values[0] if not movie_row.empty else "Unknown"  # Get director from CSV
-
-            # Step 5: Fetch trailer
-            videos_url = f'{base_url}/movie/{movie_id}/videos?api_key={TMDB_API_KEY}'
-            videos_response = requests.get(videos_url)
-            videos_response.raise_for_status()
-            videos_data = videos_response.json()
-            
-            # Extract YouTube trailer key
-            trailer_key = None
-            for video in videos_data.get('results', []):
-                if video['type'] == 'Trailer' and video['site'] == 'YouTube':
-                    trailer_key = video['key']
-                    break
-            
-            trailer_url = f"https://www.youtube.com/embed/{trailer_key}" if trailer_key else None
-            
-            # Step 6: Fetch rating
-            rating = details_data.get('vote_average', 0)
-            
-            return {
-                'title': details_data.get('title', title),
-                'poster': poster_url,
-                'release_date': details_data.get('release_date', ''),
-                'director': director,
-                'trailer': trailer_url,
-                'rating': rating
-            }
-        else:
-            return None
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error fetching movie details: {e}")
-        return None
+# With RECOMMENDER_URL set, queries go to the HTTP service (service.py) instead of an in-process engine
+RECOMMENDER_URL = os.environ.get('RECOMMENDER_URL')
+
+# Shared across reruns without pickling, so memory-mapped arrays stay shared. Keyed by the
+# artifact version: publishing a new artifact loads it on the next rerun and drops the old one.
+@st.cache_resource(max_entries=1)
+def load_data(artifact_version):
+    if RECOMMENDER_URL:
+        return RemoteRecommender(RECOMMENDER_URL)
+    return load_recommender('movies.csv', ARTIFACT_DIR)
+
+with span('load_data'):
+    recommender = load_data(None if RECOMMENDER_URL else artifact_version(ARTIFACT_DIR))
 
 # Function to add a movie to favorites
 def add_to_favorites(movie):
     if movie not in st.session_state.favorites:
         st.session_state.favorites.append(movie)
-        success_message = st.success(f"Added {movie['title']} to favorites!")
-        time.sleep(3)  # Wait for 3 seconds
-        success_message.empty()  # Remove the message
+        st.toast(f"Added {movie['title']} to favorites!", icon="✅")  # Fades out on its own, nothing blocks
+    else:
+        st.toast(f"{movie['title']} is already in favorites!", icon="⚠️")
+
+# Copy TMDB details onto a recommendation card; None (no match or TMDB down) keeps the placeholders
+def apply_details(movie, details):
+    if details:
+        movie['poster'] = details['poster']
+        movie['thumbnail'] = details.get('thumbnail') or movie.get('thumbnail')
+        movie['release_date'] = details['release_date'] or movie['release_date']
+        movie['trailer'] = details['trailer']
+        movie['rating'] = details['rating']
+    movie['details_loaded'] = True
+
+# Local thumbnail when one is cached, so the browser does not fetch the full-size poster from TMDB
+def poster_src(movie):
+    thumbnail = movie.get('thumbnail')
+    if thumbnail and os.path.exists(thumbnail):
+        return static_url(thumbnail) or movie['poster']
+    return movie['poster']
+
+def recommendation_card(movie):
+    rating = movie['rating']
+    if rating is not None:
+        stars = f"{'⭐' * int(round(rating / 2))} ({rating}/10)"
     else:
-        st.warning(f"{movie['title']} is already in favorites!")
+        stars = "Rating unavailable" if movie.get('details_loaded', True) else "Loading rating…"
+    return f"""
+                    <div class="movie-card">
+                        <img src="{poster_src(movie)}" alt="{movie['title']}">
+                        <p class="movie-title">{movie['title']}</p>
+                        <p class="movie-details"><i class="fas fa-calendar-alt"></i> {movie['release_date'][:4]}</p>
+                        <p class="movie-details"><i class="fas fa-user"></i> {movie['director']}</p>
+                        <p class="movie-details"><i class="fas fa-film"></i> {movie['genre']}</p>
+                        <div class="star-rating">
+                            {stars}
+                        </div>
+                        <p class="similarity-label">Similarity Score</p>
+                        <div class="similarity-container">
+                            <div class="similarity-bar">
+                                <div style="width: {movie['similarity']}%;"></div>
+                            </div>
+                            <div class="similarity-percent">{movie['similarity']}%</div>
+                        </div>
+                    </div>
+                    """
 
 # Custom CSS for styling
 st.markdown("""
@@ -316,6 +298,11 @@ st.markdown("""
 st.sidebar.title("  Menu")
 page = st.sidebar.radio(" ", ["Home", "Categories", "Recommendations", "Trailers", "Favorites"], index=["Home", "Categories", "Recommendations", "Trailers", "Favorites"].index(st.session_state.current_page))
 
+# Show a message left by the previous rerun (e.g. before st.rerun()) once, as a toast
+if st.session_state.notice:
+    st.toast(st.session_state.notice)
+    st.session_state.notice = None
+
 # Home Page
 if page == "Home":
     st.session_state.current_page = "Home"
@@ -327,36 +314,23 @@ if page == "Home":
     if st.button("Get Recommendations", key="get_recommendations"):
         if movie_name:
             with st.spinner(""):
-                list_of_all_titles = movies_data['title'].tolist()
-                find_close_match = difflib.get_close_matches(movie_name, list_of_all_titles)
-
-                if find_close_match:
-                    close_match = find_close_match[0]
-                    index_of_the_movie = movies_data[movies_data.title == close_match].index[0]
-
-                    similarity_score = list(enumerate(similarity[index_of_the_movie]))
-                    sorted_similar_movies = sorted(similarity_score, key=lambda x: x[1], reverse=True)
-
-                    # Store recommendations in session state
-                    st.session_state.recommendations = []
-                    for movie in sorted_similar_movies[1:11]:  # Skip the first result (input movie)
-                        index = movie[0]
-                        title_from_index = movies_data.iloc[index]['title']
-                        genre = movies_data.iloc[index]['genres']
-                        movie_details = fetch_movie_details(title_from_index,movies_data)
-                        similarity_score = round(movie[1] * 100, 2)  # Convert similarity to percentage
-
-                        if movie_details:
-                            st.session_state.recommendations.append({
-                                'title': title_from_index,
-                                'genre': genre,
-                                'poster': movie_details['poster'],
-                                'release_date': movie_details['release_date'],
-                                'director': movie_details['director'],
-                                'trailer': movie_details['trailer'],
-                                'similarity': similarity_score,
-                                'rating': movie_details['rating']
-                            })
+                result = recommender.recommend_query(movie_name, k=10)
+
+                if result:
+                    # Store recommendations in session state, from catalog data only: no network wait here.
+                    # Posters, ratings and trailers are filled in on the Recommendations page as they arrive.
+                    st.session_state.recommendations = [{
+                        'title': movie['title'],
+                        'tmdb_id': movie.get('tmdb_id'),
+                        'genre': movie['genres'],
+                        'poster': PLACEHOLDER_POSTER,
+                        'release_date': str(movie.get('year') or ''),
+                        'director': movie['director'],
+                        'trailer': None,
+                        'similarity': round(movie['similarity'] * 100, 2),  # Convert similarity to percentage
+                        'rating': None,
+                        'details_loaded': False,
+                    } for movie in result['recommendations']]
 
                     # Redirect to Recommendations page
                     st.session_state.current_page = "Recommendations"
@@ -379,25 +353,21 @@ elif page == "Categories":
         st.session_state.selected_subfilter = ""
     if "filtered_movies" not in st.session_state:
         st.session_state.filtered_movies = []
-    if "movies_loaded" not in st.session_state:
-        st.session_state.movies_loaded = 20
+    if "category_page" not in st.session_state:
+        st.session_state.category_page = 0
 
     st.session_state.current_page = "Categories"
     st.title("🎬 Categories")
 
     # --- Genre-Based Filtering ---
     st.subheader("📌 Filter by Genre")
-    unique_genre_sets = set()
-    for genre_string in movies_data['genres'].dropna():
-        genre_tuple = tuple(sorted(genre_string.split(', ')))
-        unique_genre_sets.add(genre_tuple)
-
-    formatted_genres = sorted([' '.join(g) for g in unique_genre_sets])
+    facet_options = recommender.facet_options()
+    formatted_genres = facet_options['genres']
     selected_genre = st.selectbox("Choose a genre", [""] + formatted_genres, index=0, key="selected_genre")
 
     # --- Director-Based Filtering ---
     st.subheader("🎥 Filter by Director")
-    directors = sorted(movies_data['director'].dropna().unique().tolist())
+    directors = facet_options['directors']
     selected_director = st.selectbox("Choose a director", [""] + directors, index=0, key="selected_director")
 
     # --- Decade-Based Filtering ---
@@ -432,33 +402,38 @@ elif page == "Categories":
         selected_subfilter = ""
 
     # --- Apply Filters ---
-    filtered_movies = movies_data.copy()
+    # Resolved against the prebuilt facet index: row ids only, no DataFrame copy
+    year_range = None
     filters_applied = False
-    total_movies = 0
 
     if selected_decade and selected_subfilter:
-        start_year, end_year = map(int, selected_subfilter.split('-'))
-        filtered_movies = filtered_movies[
-            (filtered_movies['release_date'].astype(str).str[:4].astype(float) >= start_year) &
-            (filtered_movies['release_date'].astype(str).str[:4].astype(float) <= end_year)
-        ]
-        total_movies = len(filtered_movies)
+        year_range = tuple(map(int, selected_subfilter.split('-')))
         filters_applied = True
     elif selected_decade:
         st.warning("Please select a sub-filter range to display movies.")
 
-    if selected_genre:
-        selected_genre_sorted = ' '.join(sorted(selected_genre.split()))
-        filtered_movies = filtered_movies[
-            filtered_movies['genres'].fillna('').apply(lambda g: ' '.join(sorted(g.split(', '))) == selected_genre_sorted)
-        ]
-        total_movies = len(filtered_movies)
+    if selected_genre or selected_director:
         filters_applied = True
 
-    if selected_director:
-        filtered_movies = filtered_movies[filtered_movies['director'] == selected_director]
-        total_movies = len(filtered_movies)
-        filters_applied = True
+    # One page of the filter's row ids at a time: page N costs the same lookups and widgets as page 1
+    movies_per_page = 20
+    filter_key = (selected_genre, selected_director, year_range)
+    if st.session_state.get("category_filters") != filter_key:
+        st.session_state.category_filters = filter_key
+        st.session_state.category_page = 0
+    filtered = {'total': 0, 'movies': []}
+    if filters_applied:
+        filtered = recommender.filter_movies(selected_genre, selected_director, year_range,
+                                             offset=st.session_state.category_page * movies_per_page,
+                                             limit=movies_per_page)
+        if not filtered['movies'] and filtered['total'] and st.session_state.category_page:
+            # The catalog shrank under this page (a new artifact): show the last page instead
+            st.session_state.category_page = (filtered['total'] - 1) // movies_per_page
+            filtered = recommender.filter_movies(selected_genre, selected_director, year_range,
+                                                 offset=st.session_state.category_page * movies_per_page,
+                                                 limit=movies_per_page)
+    total_movies = filtered['total']
+    page_count = max(1, -(-total_movies // movies_per_page))
 
     # --- Display Total Movies Count with Title ---
     if filters_applied:
@@ -468,41 +443,63 @@ elif page == "Categories":
         #else:
             #st.warning("No movies found in this range.")
 
-    # --- Lazy Loading for All Three Filters ---
-    if filters_applied and not filtered_movies.empty:
-        movies_per_load = 20
-        displayed_movies = filtered_movies.iloc[:st.session_state.movies_loaded]
+    # --- Paged Results for All Three Filters ---
+    # Cells are drawn from catalog data first; poster and rating slots are filled at the end of the page
+    grid_slots = []
+    if filters_applied and total_movies > 0:
+        displayed_movies = filtered['movies']
 
         cols = st.columns(5)
-        for i, (_, movie) in enumerate(displayed_movies.iterrows()):
+        for i, movie in enumerate(displayed_movies):
             with cols[i % 5]:
-                movie_title = movie['title']
-                movie_details = fetch_movie_details(movie_title, movies_data)
-
-                if movie_details:
-                    release_year = str(movie.get('release_date', 'N/A'))[:4]
-                    director_name = movie_details.get('director', 'N/A')
-                    rating = movie_details.get('rating', 'N/A')
-
-                    st.image(movie_details['poster'], use_container_width=True)
-                    st.write(f"**{movie_title}**")
-                    st.write(f"🎬 {director_name}")
-                    st.write(f"📅 {release_year}  |  ⭐ {rating}")
-
-        if len(filtered_movies) > st.session_state.movies_loaded:
-            if st.button("⬇️ Load More", key="load_more", help="Click to load more movies", use_container_width=True):
-                st.session_state.movies_loaded += movies_per_load
-                st.rerun()
+                release_year = movie.get('year') or 'N/A'
+                director_name = movie.get('director') or 'N/A'
+
+                poster_slot = st.empty()
+                poster_slot.image(PLACEHOLDER_POSTER, use_container_width=True)
+                st.write(f"**{movie['title']}**")
+                st.write(f"🎬 {director_name}")
+                info_slot = st.empty()
+                info_slot.write(f"📅 {release_year}  |  ⭐ …")
+                grid_slots.append((poster_slot, info_slot, release_year))
+
+        if page_count > 1:
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            with prev_col:
+                if st.button("⬅️ Previous", key="prev_page", disabled=st.session_state.category_page == 0,
+                             use_container_width=True):
+                    st.session_state.category_page -= 1
+                    st.rerun()
+            with page_col:
+                st.markdown(f"<p style='text-align: center;'>Page {st.session_state.category_page + 1} of {page_count}</p>",
+                            unsafe_allow_html=True)
+            with next_col:
+                if st.button("Next ➡️", key="next_page", disabled=st.session_state.category_page + 1 >= page_count,
+                             use_container_width=True):
+                    st.session_state.category_page += 1
+                    st.rerun()
     elif filters_applied:
         st.warning("No movies found for the selected filters.")
 
     # --- Reset Filtering Button (Appears Only When Filters Are Applied) ---
     if selected_genre or selected_director or selected_decade or (selected_decade and selected_subfilter):
         if st.button("🔄 Reset Filtering", key="reset_filter",use_container_width=True):
-            for key in ["selected_genre", "selected_director", "selected_decade", "selected_subfilter", "filtered_movies", "movies_loaded"]:
+            for key in ["selected_genre", "selected_director", "selected_decade", "selected_subfilter", "filtered_movies", "category_page"]:
                 del st.session_state[key]
             st.rerun()
 
+    # Fill in posters and ratings as lookups complete (cached ones first)
+    if grid_slots:
+        for i, movie_details in fetch_as_completed([movie['title'] for movie in displayed_movies],
+                                                   tmdb_ids=[movie.get('tmdb_id') for movie in displayed_movies],
+                                                   thumbnail_width=GRID_5_WIDTH):
+            poster_slot, info_slot, release_year = grid_slots[i]
+            if movie_details:
+                poster_slot.image(movie_details['thumbnail'] or movie_details['poster'], use_container_width=True)
+                info_slot.write(f"📅 {release_year}  |  ⭐ {movie_details.get('rating', 'N/A')}")
+            else:
+                info_slot.write(f"📅 {release_year}  |  ⭐ N/A")
+
 # Recommendations Page
 elif page == "Recommendations":
     st.session_state.current_page = "Recommendations"
@@ -511,31 +508,12 @@ elif page == "Recommendations":
     if st.session_state.recommendations:
         st.write("Here are the top 10 similar movies:")
         cols = st.columns(4)  # Display 4 movies per row
+        card_slots = []
         for i, movie in enumerate(st.session_state.recommendations):
             with cols[i % 4]:
-                # Movie card
-                st.markdown(
-                    f"""
-                    <div class="movie-card">
-                        <img src="{movie['poster']}" alt="{movie['title']}">
-                        <p class="movie-title">{movie['title']}</p>
-                        <p class="movie-details"><i class="fas fa-calendar-alt"></i> {movie['release_date'][:4]}</p>
-                        <p class="movie-details"><i class="fas fa-user"></i> {movie['director']}</p>
-                        <p class="movie-details"><i class="fas fa-film"></i> {movie['genre']}</p>
-                        <div class="star-rating">
-                            {'⭐' * int(round(movie['rating'] / 2))} ({movie['rating']}/10)
-                        </div>
-                        <p class="similarity-label">Similarity Score</p>
-                        <div class="similarity-container">
-                            <div class="similarity-bar">
-                                <div style="width: {movie['similarity']}%;"></div>
-                            </div>
-                            <div class="similarity-percent">{movie['similarity']}%</div>
-                        </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+                # Movie card, redrawn in place when its TMDB details arrive
+                card_slots.append(st.empty())
+                card_slots[i].markdown(recommendation_card(movie), unsafe_allow_html=True)
                 # Add a button to add the movie to favorites
                 if st.button(f"Add {movie['title']} to Favorites", key=f"add_{i}"):
                     add_to_favorites(movie)
@@ -543,9 +521,7 @@ elif page == "Recommendations":
                 # Add a button to watch the trailer
                 if st.button(f"Watch Trailer for {movie['title']}", key=f"trailer_{i}"):
                     st.session_state.selected_movie = movie
-                    success_message = st.success(f"Redirecting to Trailers page to watch the trailer for {movie['title']}...")
-                    time.sleep(2)  # Wait for 2 seconds
-                    success_message.empty()  # Remove the message
+                    st.session_state.notice = f"Now playing the trailer for {movie['title']}"  # Shown after the redirect
                     st.session_state.current_page = "Trailers"
                     st.rerun()  # Redirect to Trailers page
     else:
@@ -566,6 +542,16 @@ elif page == "Recommendations":
             st.session_state.current_page = "Favorites"
             st.rerun()  # Redirect to Favorites Page
 
+    # Fill in the cards still showing placeholders, each as soon as its lookup completes
+    pending = [movie for movie in st.session_state.recommendations if not movie.get('details_loaded', True)]
+    if pending:
+        slot_of = {id(movie): slot for movie, slot in zip(st.session_state.recommendations, card_slots)}
+        for i, movie_details in fetch_as_completed([movie['title'] for movie in pending],
+                                                   tmdb_ids=[movie.get('tmdb_id') for movie in pending],
+                                                   thumbnail_width=GRID_4_WIDTH):
+            apply_details(pending[i], movie_details)
+            slot_of[id(pending[i])].markdown(recommendation_card(pending[i]), unsafe_allow_html=True)
+
 # Trailers Page
 elif page == "Trailers":
     st.session_state.current_page = "Trailers"
@@ -587,6 +573,10 @@ elif page == "Trailers":
     
     # Display the trailer for the selected movie
     if st.session_state.selected_movie:
+        if not st.session_state.selected_movie.get('details_loaded', True):
+            # Picked before its card finished loading
+            movie = st.session_state.selected_movie
+            apply_details(movie, fetch_movie_details(movie['title'], tmdb_id=movie.get('tmdb_id')))
         st.write(f"### Trailer for {st.session_state.selected_movie['title']}")
         if st.session_state.selected_movie['trailer']:
             st.video(st.session_state.selected_movie['trailer'])
@@ -614,7 +604,7 @@ elif page == "Favorites":
                 st.markdown(
                     f"""
                     <div class="movie-card">
-                        <img src="{movie['poster']}" alt="{movie['title']}">
+                        <img src="{poster_src(movie)}" alt="{movie['title']}">
                         <p class="movie-title">{movie['title']}</p>
                         <p class="movie-details"><i class="fas fa-film"></i> {movie['genre']}</p>
                     </div>
@@ -639,4 +629,17 @@ elif page == "Favorites":
     with col2:
         if st.button("Go to Recommendations"):
             st.session_state.current_page = "Recommendations"
-            st.rerun()
\ No newline at end of file
+            st.rerun()
+
+# Debug timing panel (opt-in)
+log_trace(trace)
+if DEBUG_PANEL:
+    with st.sidebar.expander("⏱️ Timings (this rerun)", expanded=True):
+        st.write(f"**Total:** {trace.elapsed() * 1000:.1f} ms")
+        st.table(pd.DataFrame(
+            [(name, round(total * 1000, 2), calls) for name, total, calls in trace.summary()],
+            columns=["span", "ms", "calls"],
+        ))
+        if trace.counters:
+            st.table(pd.DataFrame(sorted(trace.counters.items()), columns=["counter", "count"]))
+        st.download_button("Export metrics (Prometheus)", metrics.prometheus_text(), file_name="metrics.prom")
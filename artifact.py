@@ -0,0 +1,384 @@
+"""Build and load the on-disk model artifact.
+
+The artifact holds everything `load_data()` would otherwise recompute on
+every process boot: the per-field TF-IDF vocabularies and idf weights, the
+normalized feature matrix as CSR parts (.npy) with its per-field row norms
+(see features.py), the title index and the neighbour table.
+Arrays are opened memory-mapped, so worker processes share pages through
+the OS cache instead of each holding a private copy.
+
+The serving catalog (titles, dictionary-encoded genres and directors,
+years) and the facet posting arrays are stored the same way, so a worker
+attaches to a published artifact without reading the CSV. Every publish
+gets a new `artifact_id`; workers poll `artifact_version()` and reload when
+it changes. The swap replaces the directory, and files that workers still
+have mapped stay readable until they let go of them.
+
+Build it with:
+
+    python artifact.py [movies.csv] [artifact_dir] [--chunk-size 100000] [--neighbours-k 50]
+
+With --chunk-size the CSV is streamed: only one chunk of rows is in memory
+at a time and the matrix is written to disk shard by shard, so catalogs
+larger than RAM can be indexed. The result is the same artifact.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from scipy.sparse import csr_matrix
+
+from catalog import Catalog, release_years, tmdb_ids
+from facets import FacetIndex
+from features import SELECTED_FEATURES, FeaturePipeline, FieldLayout, field_mass, make_vectorizer
+from similarity import SimilarityEngine
+
+ARTIFACT_VERSION = 3  # 2: catalog arrays include TMDB ids; 3: per-field feature blocks
+ARTIFACT_DIR = 'artifact'
+NEIGHBOURS_K = 50
+CHUNK_SIZE = 100_000
+LOAD_ATTEMPTS = 5
+LOAD_RETRY_DELAY = 0.05  # Seconds; a publish swaps the directory with two renames
+
+
+def csv_hash(csv_path):
+    """SHA-256 of the CSV contents, used to detect a stale artifact."""
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prepare_movies(movies_data):
+    for feature in SELECTED_FEATURES:
+        movies_data[feature] = movies_data[feature].fillna('')
+    return movies_data
+
+
+def build_model(movies_data, neighbours_k=NEIGHBOURS_K, field_weights=None):
+    """Fit the per-field TF-IDF pipeline on a prepared frame and return (pipeline, similarity engine)."""
+    pipeline = FeaturePipeline.fit(movies_data, field_weights)
+    similarity = SimilarityEngine(pipeline.transform(movies_data), normalized=True)
+    similarity.fields = pipeline.layout(similarity.matrix)
+    if neighbours_k:
+        similarity.build_neighbours(k=neighbours_k)
+    return pipeline, similarity
+
+
+def save_artifact(artifact_dir, pipeline, similarity, titles, source_hash, extra=None, catalog=None):
+    """Write the artifact to a temp dir, then swap it into place."""
+    tmp_dir = _make_tmp_dir(artifact_dir)
+    matrix = similarity.matrix
+
+    np.save(os.path.join(tmp_dir, 'data.npy'), matrix.data.astype(np.float32))
+    np.save(os.path.join(tmp_dir, 'indices.npy'), matrix.indices)
+    np.save(os.path.join(tmp_dir, 'indptr.npy'), matrix.indptr)
+    if similarity.neighbour_ids is not None:
+        np.save(os.path.join(tmp_dir, 'neighbour_ids.npy'), similarity.neighbour_ids)
+        np.save(os.path.join(tmp_dir, 'neighbour_scores.npy'), similarity.neighbour_scores)
+    _save_features(tmp_dir, pipeline, similarity.fields.mass, titles)
+    if catalog is not None:
+        _save_serving(tmp_dir, catalog)
+
+    manifest = {
+        'version': ARTIFACT_VERSION,
+        'csv_sha256': source_hash,
+        'shape': list(matrix.shape),
+        'neighbours_k': int(similarity.neighbour_ids.shape[1]) if similarity.neighbour_ids is not None else 0,
+        'serving': catalog is not None,
+        **(extra or {}),
+    }
+    return _publish(tmp_dir, artifact_dir, manifest)
+
+
+def read_manifest(artifact_dir):
+    try:
+        with open(os.path.join(artifact_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_artifact(artifact_dir, csv_path, attempts=LOAD_ATTEMPTS):
+    """Load the artifact memory-mapped, or return None if it is missing or stale.
+
+    A publish can swap the directory while the files are being opened, so the
+    manifest is read again afterwards and the load retried if the artifact_id
+    changed. A missing manifest may be a publish between its two renames, so it
+    is also retried briefly before giving up.
+    """
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(LOAD_RETRY_DELAY)
+        manifest = read_manifest(artifact_dir)
+        if manifest is None:
+            continue
+        if manifest.get('version') != ARTIFACT_VERSION or manifest.get('csv_sha256') != csv_hash(csv_path):
+            return None
+        try:
+            artifact = _open_artifact(artifact_dir, manifest)
+        except (OSError, ValueError, KeyError):
+            continue  # Files swapped out from under us
+        if artifact_version(artifact_dir) == manifest.get('artifact_id'):
+            return artifact
+    return None
+
+
+def _open_artifact(artifact_dir, manifest):
+    def load(name):
+        return np.load(os.path.join(artifact_dir, name), mmap_mode='r')
+
+    matrix = csr_matrix(
+        (load('data.npy'), load('indices.npy'), load('indptr.npy')),
+        shape=tuple(manifest['shape']),
+        copy=False,
+    )
+    has_neighbours = manifest.get('neighbours_k', 0) > 0
+    similarity = SimilarityEngine(
+        matrix,
+        neighbour_ids=load('neighbour_ids.npy') if has_neighbours else None,
+        neighbour_scores=load('neighbour_scores.npy') if has_neighbours else None,
+        normalized=True,
+    )
+    with open(os.path.join(artifact_dir, 'features.json')) as f:
+        features = json.load(f)
+    similarity.fields = FieldLayout(features['fields'], features['offsets'], features['weights'],
+                                    load('field_mass.npy'))
+    with open(os.path.join(artifact_dir, 'titles.json')) as f:
+        titles = json.load(f)
+    catalog = facets = None
+    if manifest.get('serving'):
+        catalog, facets = _load_serving(artifact_dir)
+    return {'manifest': manifest, 'similarity': similarity, 'titles': titles, 'catalog': catalog, 'facets': facets}
+
+
+def artifact_version(artifact_dir):
+    """Id of the currently published artifact (changes on every publish), or None."""
+    manifest = read_manifest(artifact_dir)
+    return manifest.get('artifact_id') if manifest else None
+
+
+def load_pipeline(artifact_dir):
+    """Rebuild the fitted feature pipeline from the stored vocabularies, idf and field weights."""
+    with open(os.path.join(artifact_dir, 'vocabulary.json')) as f:
+        vocabularies = json.load(f)
+    with open(os.path.join(artifact_dir, 'features.json')) as f:
+        weights = json.load(f)['weights']
+    return FeaturePipeline.from_vocabularies(vocabularies, np.load(os.path.join(artifact_dir, 'idf.npy')), weights)
+
+
+def build_artifact(csv_path='movies.csv', artifact_dir=ARTIFACT_DIR, neighbours_k=NEIGHBOURS_K):
+    movies_data = prepare_movies(pd.read_csv(csv_path))
+    pipeline, similarity = build_model(movies_data, neighbours_k)
+    return save_artifact(artifact_dir, pipeline, similarity, movies_data['title'].tolist(), csv_hash(csv_path),
+                         catalog=Catalog.from_frame(movies_data))
+
+
+def build_artifact_streaming(csv_path='movies.csv', artifact_dir=ARTIFACT_DIR, neighbours_k=NEIGHBOURS_K,
+                             chunk_size=CHUNK_SIZE):
+    """Build the artifact while holding only `chunk_size` rows of the CSV in memory.
+
+    Pass 1 counts document frequencies per field, which fixes each field's
+    vocabulary and idf weights exactly as TfidfVectorizer.fit would. Pass 2
+    vectorizes chunk by chunk into CSR shards on disk, which are then
+    concatenated into the memory-mapped arrays the loader expects.
+    """
+    analyzers = {field: make_vectorizer(field).build_analyzer() for field in SELECTED_FEATURES}
+    document_frequency = {field: Counter() for field in SELECTED_FEATURES}
+    titles, genres, directors, years, ids = [], [], [], [], []
+    for chunk in _read_chunks(csv_path, chunk_size):
+        titles.extend(chunk['title'].tolist())
+        genres.extend(chunk['genres'])
+        directors.extend(chunk['director'])
+        years.append(release_years(chunk['release_date']))
+        ids.append(tmdb_ids(chunk))
+        for field, analyzer in analyzers.items():
+            for text in chunk[field]:
+                document_frequency[field].update(set(analyzer(text)))
+    n = len(titles)
+    vectorizers = {}
+    for field in SELECTED_FEATURES:
+        counts = document_frequency.pop(field)
+        terms = sorted(counts)
+        frequency = np.array([counts[term] for term in terms], dtype=np.float64)
+        # Smoothed idf, as TfidfVectorizer computes it
+        idf = (np.log((1 + n) / (1 + frequency)) + 1).astype(np.float32)
+        vectorizers[field] = make_vectorizer(field, {term: i for i, term in enumerate(terms)}, idf)
+    pipeline = FeaturePipeline(vectorizers)
+
+    tmp_dir = _make_tmp_dir(artifact_dir)
+    shard_dir = os.path.join(tmp_dir, 'shards')
+    os.mkdir(shard_dir)
+    shards, nnz = 0, 0
+    for chunk in _read_chunks(csv_path, chunk_size):
+        part = pipeline.transform(chunk)  # Rows come out L2-normalized
+        np.save(os.path.join(shard_dir, f'{shards:05d}-data.npy'), part.data.astype(np.float32))
+        np.save(os.path.join(shard_dir, f'{shards:05d}-indices.npy'), part.indices)
+        np.save(os.path.join(shard_dir, f'{shards:05d}-lengths.npy'), np.diff(part.indptr))
+        shards += 1
+        nnz += part.nnz
+    _concatenate_shards(tmp_dir, shard_dir, shards, n, nnz)
+    shutil.rmtree(shard_dir)
+
+    shape = (n, int(pipeline.offsets[-1]))
+
+    def load(name):
+        return np.load(os.path.join(tmp_dir, name), mmap_mode='r')
+
+    matrix = csr_matrix((load('data.npy'), load('indices.npy'), load('indptr.npy')), shape=shape, copy=False)
+    _save_features(tmp_dir, pipeline, field_mass(matrix, pipeline.offsets), titles)
+    saved_k = 0
+    if neighbours_k and n > 1:
+        neighbour_ids, neighbour_scores = SimilarityEngine(matrix, normalized=True).build_neighbours(k=neighbours_k)
+        np.save(os.path.join(tmp_dir, 'neighbour_ids.npy'), neighbour_ids)
+        np.save(os.path.join(tmp_dir, 'neighbour_scores.npy'), neighbour_scores)
+        saved_k = int(neighbour_ids.shape[1])
+    del matrix
+    catalog = Catalog.from_columns(pd.Series(titles).fillna('').astype(str), genres, directors,
+                                   np.concatenate(years) if years else [], np.concatenate(ids) if ids else [])
+    del titles, genres, directors
+    _save_serving(tmp_dir, catalog)
+
+    manifest = {
+        'version': ARTIFACT_VERSION,
+        'csv_sha256': csv_hash(csv_path),
+        'shape': list(shape),
+        'neighbours_k': saved_k,
+        'serving': True,
+        'chunk_size': chunk_size,
+    }
+    return _publish(tmp_dir, artifact_dir, manifest)
+
+
+def _read_chunks(csv_path, chunk_size):
+    # Only the columns the model needs; str dtype keeps chunk-by-chunk type inference consistent
+    columns = ['title'] + SELECTED_FEATURES + ['release_date', 'id']
+    for chunk in pd.read_csv(csv_path, usecols=lambda c: c in columns, dtype=dict.fromkeys(columns, str),
+                             chunksize=chunk_size):
+        yield prepare_movies(chunk)
+
+
+def _concatenate_shards(tmp_dir, shard_dir, shards, rows, nnz):
+    # int32 offsets unless the matrix is too big for them; indices share the dtype so scipy does not copy
+    index_dtype = np.int32 if nnz <= np.iinfo(np.int32).max else np.int64
+    data = open_memmap(os.path.join(tmp_dir, 'data.npy'), mode='w+', dtype=np.float32, shape=(nnz,))
+    indices = open_memmap(os.path.join(tmp_dir, 'indices.npy'), mode='w+', dtype=index_dtype, shape=(nnz,))
+    indptr = open_memmap(os.path.join(tmp_dir, 'indptr.npy'), mode='w+', dtype=index_dtype, shape=(rows + 1,))
+    indptr[0] = 0
+    position, row = 0, 0
+    for shard in range(shards):
+        part_data = np.load(os.path.join(shard_dir, f'{shard:05d}-data.npy'))
+        lengths = np.load(os.path.join(shard_dir, f'{shard:05d}-lengths.npy'))
+        data[position:position + len(part_data)] = part_data
+        indices[position:position + len(part_data)] = np.load(os.path.join(shard_dir, f'{shard:05d}-indices.npy'))
+        indptr[row + 1:row + 1 + len(lengths)] = position + np.cumsum(lengths)
+        position += len(part_data)
+        row += len(lengths)
+    for array in (data, indices, indptr):
+        array.flush()
+
+
+def _make_tmp_dir(artifact_dir):
+    parent = os.path.dirname(os.path.abspath(artifact_dir))
+    return tempfile.mkdtemp(prefix='.artifact-', dir=parent)
+
+
+def _save_features(tmp_dir, pipeline, mass, titles):
+    # features.json is all a worker reads; vocabularies and idf are only for transforming new rows
+    np.save(os.path.join(tmp_dir, 'idf.npy'), pipeline.idf)
+    np.save(os.path.join(tmp_dir, 'field_mass.npy'), np.asarray(mass, dtype=np.float32))
+    with open(os.path.join(tmp_dir, 'features.json'), 'w') as f:
+        json.dump({'fields': pipeline.fields, 'offsets': pipeline.offsets.tolist(), 'weights': pipeline.weights}, f)
+    with open(os.path.join(tmp_dir, 'vocabulary.json'), 'w') as f:
+        json.dump({field: {term: int(i) for term, i in vectorizer.vocabulary_.items()}
+                   for field, vectorizer in pipeline.vectorizers.items()}, f)
+    with open(os.path.join(tmp_dir, 'titles.json'), 'w') as f:
+        json.dump(list(titles), f)
+
+
+def _save_serving(tmp_dir, catalog):
+    for name, array in catalog.arrays().items():
+        np.save(os.path.join(tmp_dir, f'catalog_{name}.npy'), array)
+    for name, array in FacetIndex(catalog).arrays.items():
+        np.save(os.path.join(tmp_dir, f'facet_{name}.npy'), array)
+    with open(os.path.join(tmp_dir, 'catalog_values.json'), 'w') as f:
+        json.dump({'genres': catalog.genre_values, 'directors': catalog.director_values}, f)
+
+
+def _load_serving(artifact_dir):
+    # Read-only memory maps: every worker shares the same pages and none can write to them
+    arrays = {}
+    for filename in os.listdir(artifact_dir):
+        if filename.startswith(('catalog_', 'facet_')) and filename.endswith('.npy'):
+            arrays[filename[:-4]] = np.load(os.path.join(artifact_dir, filename), mmap_mode='r')
+    with open(os.path.join(artifact_dir, 'catalog_values.json')) as f:
+        values = json.load(f)
+    catalog = Catalog(
+        arrays['catalog_title_buffer'], arrays['catalog_title_offsets'],
+        arrays['catalog_genre_codes'], values['genres'],
+        arrays['catalog_director_codes'], values['directors'],
+        arrays['catalog_years'], arrays['catalog_tmdb_ids'],
+    )
+    facet_arrays = {name[len('facet_'):]: array for name, array in arrays.items() if name.startswith('facet_')}
+    return catalog, FacetIndex(catalog, facet_arrays)
+
+
+def republish(artifact_dir, artifact_id=None):
+    """Give the published artifact a new artifact_id in place, so workers reload it (e.g. after ann.py build)."""
+    manifest = read_manifest(artifact_dir)
+    manifest = {**manifest, 'artifact_id': artifact_id or uuid.uuid4().hex, 'published_at': time.time()}
+    fd, tmp_path = tempfile.mkstemp(prefix='.manifest-', dir=artifact_dir)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(artifact_dir, 'manifest.json'))
+    return manifest
+
+
+def _publish(tmp_dir, artifact_dir, manifest):
+    manifest = {**manifest, 'artifact_id': uuid.uuid4().hex, 'published_at': time.time()}
+    try:
+        if os.path.isdir(artifact_dir):
+            from ann import carry_over_ann  # ann.py imports this module
+            carry_over_ann(artifact_dir, tmp_dir, manifest)
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)  # Nothing was published; do not leave the build behind
+        raise
+    # Move the old directory aside first so the new one appears with a single rename
+    retired = None
+    if os.path.exists(artifact_dir):
+        retired = tempfile.mkdtemp(prefix='.retired-', dir=os.path.dirname(os.path.abspath(artifact_dir)))
+        os.rename(artifact_dir, os.path.join(retired, 'artifact'))
+    os.rename(tmp_dir, artifact_dir)
+    if retired is not None:
+        shutil.rmtree(retired)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the model artifact.')
+    parser.add_argument('csv', nargs='?', default='movies.csv')
+    parser.add_argument('artifact_dir', nargs='?', default=ARTIFACT_DIR)
+    parser.add_argument('--chunk-size', type=int, help='stream the CSV this many rows at a time')
+    parser.add_argument('--neighbours-k', type=int, default=NEIGHBOURS_K)
+    args = parser.parse_args()
+    if args.chunk_size:
+        manifest = build_artifact_streaming(args.csv, args.artifact_dir, args.neighbours_k, args.chunk_size)
+    else:
+        manifest = build_artifact(args.csv, args.artifact_dir, args.neighbours_k)
+    print(f"Wrote {args.artifact_dir}: {manifest['shape'][0]} movies, {manifest['shape'][1]} terms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""Benchmark load, query, filter and metadata-fetch paths on synthetic catalogs.
+
+    python benchmark.py [--sizes 5000 50000 500000] [--out bench_results.json]
+                        [--workdir bench_data] [--queries 200] [--fetch-titles 200]
+                        [--tmdb-latency-ms 20] [--neighbours-k 50]
+
+For each size a synthetic movies.csv with the same columns as the real one
+is generated (and reused on later runs), then measured in a fresh
+subprocess so peak RSS is per size:
+
+- cold load by fitting TF-IDF, artifact build time and artifact load time
+- peak RSS
+- p50/p99 latency of Home queries (exact and misspelled titles, uncached and
+  repeated from the result cache) and of exact scoring beyond the neighbour table
+- p50/p99 latency of Categories filter combinations
+- metadata fetch throughput against a local mock TMDB server
+
+Results are written as JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import latency_summary, peak_rss_mb
+
+COLUMNS = [
+    'index', 'budget', 'genres', 'homepage', 'id', 'keywords', 'original_language', 'original_title',
+    'overview', 'popularity', 'production_companies', 'production_countries', 'release_date', 'revenue',
+    'runtime', 'spoken_languages', 'status', 'tagline', 'title', 'vote_average', 'vote_count', 'cast',
+    'crew', 'director',
+]
+GENRES = [
+    'Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family', 'Fantasy',
+    'History', 'Horror', 'Music', 'Mystery', 'Romance', 'Science Fiction', 'Thriller', 'War', 'Western',
+]
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ten', 'vor', 'shi', 'an', 'del', 'ur', 'bel', 'mon', 'tri', 'zen', 'qua', 'fi']
+DECADES = [(start, start + 9) for start in range(1920, 2030, 10)]
+
+
+def _words(rng, count, min_syllables=2, max_syllables=4):
+    return [''.join(rng.choice(SYLLABLES, rng.integers(min_syllables, max_syllables + 1)))
+            for _ in range(count)]
+
+
+def generate_catalog(path, rows, seed=0):
+    """Write a synthetic movies.csv with `rows` rows and the real file's columns."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(sorted(set(_words(rng, 20000))))
+    first_names = np.array([w.title() for w in _words(rng, 400, 1, 2)])
+    last_names = np.array([w.title() for w in _words(rng, 800, 2, 3)])
+    directors = np.array([f'{f} {l}' for f, l in zip(rng.choice(first_names, max(50, rows // 8)),
+                                                       rng.choice(last_names, max(50, rows // 8)))])
+
+    # Zipf-like term popularity, like real keywords and cast
+    term_p = 1.0 / np.arange(1, len(vocabulary) + 1) ** 0.9
+    term_p /= term_p.sum()
+    genre_p = np.linspace(2.0, 0.5, len(GENRES))
+    genre_p /= genre_p.sum()
+
+    def pick(pool, p, low, high):
+        return [' '.join(pool[rng.choice(len(pool), rng.integers(low, high + 1), replace=False, p=p)])
+                for _ in range(rows)]
+
+    titles = [' '.join(w.title() for w in rng.choice(vocabulary, rng.integers(1, 4), p=term_p))
+              for _ in range(rows)]
+    years = rng.integers(1920, 2025, rows)
+    release_dates = [f'{y}-{m:02d}-{d:02d}' for y, m, d in
+                     zip(years, rng.integers(1, 13, rows), rng.integers(1, 29, rows))]
+    cast_pool = np.array([f'{f} {l}' for f, l in zip(rng.choice(first_names, 30000), rng.choice(last_names, 30000))])
+    cast_p = 1.0 / np.arange(1, len(cast_pool) + 1) ** 0.8
+    cast_p /= cast_p.sum()
+
+    frame = pd.DataFrame({
+        'index': np.arange(rows),
+        'budget': rng.integers(0, 300_000_000, rows),
+        'genres': pick(np.array(GENRES), genre_p, 1, 4),
+        'homepage': '',
+        'id': np.arange(rows) + 1,
+        'keywords': pick(vocabulary, term_p, 0, 8),
+        'original_language': 'en',
+        'original_title': titles,
+        'overview': '',
+        'popularity': rng.gamma(2.0, 10.0, rows).round(6),
+        'production_companies': '[]',
+        'production_countries': '[]',
+        'release_date': release_dates,
+        'revenue': rng.integers(0, 1_000_000_000, rows),
+        'runtime': rng.integers(70, 200, rows),
+        'spoken_languages': '[]',
+        'status': 'Released',
+        'tagline': [' '.join(rng.choice(vocabulary, rng.integers(0, 8), p=term_p)) for _ in range(rows)],
+        'title': titles,
+        'vote_average': rng.uniform(0, 10, rows).round(1),
+        'vote_count': rng.integers(0, 20000, rows),
+        'cast': pick(cast_pool, cast_p, 3, 5),
+        'crew': '[]',
+        'director': rng.choice(directors, rows),
+    }, columns=COLUMNS)
+    # Same gaps as the real data: some rows lack a director or release date
+    frame.loc[rng.random(rows) < 0.01, 'director'] = None
+    frame.loc[rng.random(rows) < 0.005, 'release_date'] = None
+    frame.to_csv(path, index=False)
+    return path
+
+
+def _timed(func, inputs):
+    samples = []
+    for item in inputs:
+        start = time.perf_counter()
+        func(item)
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+def _misspell(title, rng):
+    if len(title) < 4:
+        return title
+    i = rng.randrange(1, len(title) - 1)
+    return title[:i] + title[i + 1:]
+
+
+def run_one(csv_path, queries=200, fetch_titles=200, tmdb_latency=0.02, neighbours_k=50, seed=0):
+    """Measure one catalog in this process and return the results dict."""
+    # The artifact and metadata store are scratch data; a multi-GB artifact must not outlive the run
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        return _measure(csv_path, workdir, queries, fetch_titles, tmdb_latency, neighbours_k, seed)
+
+
+def _measure(csv_path, workdir, queries, fetch_titles, tmdb_latency, neighbours_k, seed):
+    import tmdb
+    from artifact import build_artifact
+    from mock_tmdb import start_mock_server
+    from recommender import load_recommender
+
+    rng = random.Random(seed)
+    results = {'csv': csv_path}
+
+    start = time.perf_counter()
+    recommender = load_recommender(csv_path, os.path.join(workdir, 'missing'), neighbours_k)
+    results['cold_load_fit_s'] = round(time.perf_counter() - start, 3)
+    results['peak_rss_mb_after_fit'] = peak_rss_mb()
+    results['rows'] = len(recommender.catalog)
+    results['terms'] = int(recommender.similarity.matrix.shape[1])
+    results['nnz'] = int(recommender.similarity.matrix.nnz)
+
+    artifact_dir = os.path.join(workdir, 'artifact')
+    start = time.perf_counter()
+    build_artifact(csv_path, artifact_dir, neighbours_k)
+    results['artifact_build_s'] = round(time.perf_counter() - start, 3)
+    del recommender
+    start = time.perf_counter()
+    recommender = load_recommender(csv_path, artifact_dir, neighbours_k)
+    results['cold_load_artifact_s'] = round(time.perf_counter() - start, 3)
+
+    titles = recommender.catalog.titles.tolist()
+    sample = [titles[rng.randrange(len(titles))] for _ in range(queries)]
+
+    def uncached_query(q):
+        recommender.query_cache.clear()
+        return recommender.recommend_query(q, 10)
+
+    results['query_exact_title'] = _timed(uncached_query, sample)
+    results['query_misspelled_title'] = _timed(uncached_query, [_misspell(t, rng) for t in sample])
+    recommender.recommend_query(sample[0], 10)
+    results['query_cached'] = _timed(lambda q: recommender.recommend_query(q, 10), [sample[0]] * queries)
+    rows = [rng.randrange(len(titles)) for _ in range(queries)]
+    results['query_exact_scoring'] = _timed(
+        lambda row: recommender.similarity.recommend([row], neighbours_k + 10), rows)
+
+    options = recommender.facet_options()
+    combos = []
+    for _ in range(queries):
+        genre = rng.choice(options['genres']) if rng.random() < 0.7 else None
+        director = rng.choice(options['directors']) if rng.random() < 0.3 else None
+        decade = rng.choice(DECADES)
+        year_range = (decade[0], decade[0] + 1) if rng.random() < 0.5 or not (genre or director) else None
+        combos.append((genre, director, year_range))
+    def uncached_filter(combo):
+        recommender.filter_cache.clear()
+        return recommender.filter_movies(*combo, offset=0, limit=20)
+
+    results['filter'] = _timed(uncached_filter, combos)
+
+    # Metadata fetch against a mock TMDB: no store, in-memory cache only, so every title is a miss
+    server, base_url = start_mock_server(latency=tmdb_latency)
+    tmdb.BASE_URL = base_url
+    tmdb.CACHE_PATH = None
+    tmdb.STORE_DIR = os.path.join(workdir, 'no-store')
+    tmdb.RATE_LIMIT = 0  # Measure our fetch path, not the limiter tuned for the real TMDB
+    first_rows = {}
+    for row, title in enumerate(titles[:fetch_titles * 2]):
+        first_rows.setdefault(title, row)
+    fetch_sample = list(first_rows)[:fetch_titles]
+    fetch_ids = [recommender.catalog.tmdb_id(first_rows[title]) for title in fetch_sample]
+    start = time.perf_counter()
+    for page in range(0, len(fetch_sample), 20):
+        tmdb.fetch_many(fetch_sample[page:page + 20], tmdb_ids=fetch_ids[page:page + 20])
+    elapsed = time.perf_counter() - start
+    results['fetch'] = {
+        'titles': len(fetch_sample),
+        'seconds': round(elapsed, 3),
+        'titles_per_s': round(len(fetch_sample) / elapsed, 1) if elapsed else None,
+        'tmdb_requests': server.counts['requests'],
+        'tmdb_latency_ms': tmdb_latency * 1000,
+    }
+    server.shutdown()
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 50000, 500000])
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--workdir', default='bench_data')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--fetch-titles', type=int, default=200)
+    parser.add_argument('--tmdb-latency-ms', type=float, default=20.0)
+    parser.add_argument('--neighbours-k', type=int, default=50)
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)  # CSV to measure in this process
+    args = parser.parse_args()
+
+    if args.run_one:
+        results = run_one(args.run_one, args.queries, args.fetch_titles, args.tmdb_latency_ms / 1000,
+                          args.neighbours_k)
+        json.dump(results, sys.stdout)
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {k: v for k, v in vars(args).items() if k != 'run_one'},
+        'sizes': {},
+    }
+    for size in args.sizes:
+        csv_path = os.path.join(args.workdir, f'movies_{size}.csv')
+        if not os.path.exists(csv_path):
+            print(f"Generating {csv_path}")
+            generate_catalog(csv_path, size)
+        print(f"Benchmarking {size} rows")
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', csv_path,
+                   '--queries', str(args.queries), '--fetch-titles', str(args.fetch_titles),
+                   '--tmdb-latency-ms', str(args.tmdb_latency_ms), '--neighbours-k', str(args.neighbours_k)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        report['sizes'][str(size)] = json.loads(output)
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+SERVING_COLUMNS = ['title', 'genres', 'director', 'release_date', 'id']  # id (the TMDB id) is optional
+
+
+class Catalog:
+    """Read-only, array-backed catalog holding only what serving needs.
+
+    Titles live in one UTF-8 buffer with int64 offsets, genres and directors
+    are dictionary-encoded (a small list of distinct strings plus one integer
+    code per movie), release years are int16 and TMDB ids int32 (-1 when
+    unknown). The raw text used for vectorizing is not kept.
+    """
+
+    def __init__(self, title_buffer, title_offsets, genre_codes, genre_values, director_codes, director_values,
+                 years, tmdb_ids):
+        # Arrays may be read-only memory maps shared by every worker (see artifact.load_artifact)
+        self.title_buffer = title_buffer
+        self.title_offsets = title_offsets
+        self.genre_codes = genre_codes
+        self.genre_values = genre_values
+        self.director_codes = director_codes
+        self.director_values = director_values
+        self.years = years
+        self.tmdb_ids = tmdb_ids
+
+    @classmethod
+    def from_columns(cls, titles, genres, directors, years, tmdb_ids=None):
+        encoded = [str(title).encode('utf-8') for title in titles]
+        title_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(title) for title in encoded], out=title_offsets[1:])
+        genre_codes, genre_values = _dictionary_encode(genres)
+        director_codes, director_values = _dictionary_encode(directors)
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), title_offsets, genre_codes, genre_values,
+                   director_codes, director_values, np.asarray(years, dtype=np.int16),
+                   np.full(len(encoded), -1, dtype=np.int32) if tmdb_ids is None else np.asarray(tmdb_ids, np.int32))
+
+    @classmethod
+    def from_frame(cls, movies_data):
+        return cls.from_columns(
+            movies_data['title'].fillna('').astype(str),
+            movies_data['genres'].fillna('').astype(str),
+            movies_data['director'].fillna('').astype(str),
+            release_years(movies_data['release_date']),
+            tmdb_ids(movies_data),
+        )
+
+    def arrays(self):
+        """The numeric arrays, by name, for saving next to the model."""
+        return {
+            'title_buffer': self.title_buffer,
+            'title_offsets': self.title_offsets,
+            'genre_codes': self.genre_codes,
+            'director_codes': self.director_codes,
+            'years': self.years,
+            'tmdb_ids': self.tmdb_ids,
+        }
+
+    def __len__(self):
+        return len(self.years)
+
+    def title(self, row):
+        return self.title_buffer[self.title_offsets[row]:self.title_offsets[row + 1]].tobytes().decode('utf-8')
+
+    @property
+    def titles(self):
+        return TitleColumn(self)
+
+    def genres(self, row):
+        return self.genre_values[self.genre_codes[row]]
+
+    def director(self, row):
+        return self.director_values[self.director_codes[row]]
+
+    def year(self, row):
+        year = int(self.years[row])
+        return year if year >= 0 else None
+
+    def tmdb_id(self, row):
+        tmdb_id = int(self.tmdb_ids[row])
+        return tmdb_id if tmdb_id >= 0 else None
+
+    def nbytes(self):
+        strings = sum(len(value) for value in self.genre_values) + sum(len(value) for value in self.director_values)
+        arrays = self.title_offsets.nbytes + self.genre_codes.nbytes + self.director_codes.nbytes + self.years.nbytes
+        arrays += self.tmdb_ids.nbytes
+        return self.title_buffer.nbytes + strings + arrays
+
+
+class TitleColumn:
+    """Sequence view over the catalog's titles, decoded on access."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __getitem__(self, row):
+        return self.catalog.title(row)
+
+    def __iter__(self):
+        for row in range(len(self.catalog)):
+            yield self.catalog.title(row)
+
+    def tolist(self):
+        return list(self)
+
+
+def release_years(release_dates):
+    """int16 year per movie from release_date strings, -1 when unknown."""
+    years = pd.to_numeric(release_dates.astype(str).str[:4], errors='coerce')
+    return years.fillna(-1).astype(np.int16).to_numpy()
+
+
+def tmdb_ids(movies_data):
+    """int32 TMDB id per movie from the CSV's optional id column, -1 when unknown."""
+    if 'id' not in movies_data.columns:
+        return np.full(len(movies_data), -1, dtype=np.int32)
+    return pd.to_numeric(movies_data['id'], errors='coerce').fillna(-1).astype(np.int32).to_numpy()
+
+
+def _dictionary_encode(values):
+    codes, uniques = pd.factorize(pd.Series(values), sort=True)
+    dtype = np.int16 if len(uniques) < np.iinfo(np.int16).max else np.int32
+    return codes.astype(dtype), [str(value) for value in uniques]
@@ -0,0 +1,228 @@
+"""Apply catalog deltas (append, update, delete) without refitting TF-IDF.
+
+New and updated rows are transformed with the existing per-field
+vocabularies, and the
+neighbour table is recomputed only for rows that are affected: the changed
+rows themselves, rows whose neighbour lists pointed at a changed or deleted
+movie, and rows that a new or updated movie now beats their k-th neighbour.
+Once the share of out-of-vocabulary tokens seen since the last fit passes
+`drift_threshold`, the whole model is refitted instead. Cast is counted by
+word rather than by word pair: most pairs span two names ("saldana
+sigourney") and are new in almost every movie, even when every actor is
+already known.
+
+    python catalog_updates.py [--upserts delta.csv] [--deletes titles.txt]
+                              [--csv movies.csv] [--artifact artifact] [--verify]
+
+Rows are matched by title. The updated movies.csv and artifact are written
+back in place.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import vstack
+
+from artifact import (ARTIFACT_DIR, NEIGHBOURS_K, build_model, csv_hash, load_artifact, load_pipeline,
+                      prepare_movies, save_artifact)
+from catalog import Catalog
+from features import SELECTED_FEATURES
+from similarity import SimilarityEngine
+
+DRIFT_THRESHOLD = 0.05  # New movies from the same catalog measure about 0.02
+
+
+class CatalogUpdater:
+    def __init__(self, movies_data, pipeline, similarity, tokens_seen=0, tokens_unseen=0,
+                 drift_threshold=DRIFT_THRESHOLD):
+        self.movies_data = movies_data.reset_index(drop=True)
+        self.pipeline = pipeline
+        self.similarity = similarity
+        self.tokens_seen = tokens_seen
+        self.tokens_unseen = tokens_unseen
+        self.drift_threshold = drift_threshold
+        self.refitted = False
+
+    def drift(self):
+        return self.tokens_unseen / self.tokens_seen if self.tokens_seen else 0.0
+
+    def apply(self, upserts=None, deletes=()):
+        """Upsert rows from a DataFrame (matched by title) and delete titles; returns changed positions."""
+        old = self.movies_data
+        n_old = len(old)
+        upserts = prepare_movies(upserts.copy()) if upserts is not None else old.iloc[:0]
+        upserts = upserts.reindex(columns=old.columns).reset_index(drop=True)
+
+        positions = {}
+        for pos, title in enumerate(old['title']):
+            positions.setdefault(title, pos)
+        deleted = {positions[title] for title in deletes if title in positions}
+
+        # Layout of the new catalog as source rows into old + upserts stacked together
+        source = [pos for pos in range(n_old) if pos not in deleted]
+        new_pos_of_old = np.full(n_old, -1, dtype=np.int64)
+        new_pos_of_old[source] = np.arange(len(source))
+        replaced = []
+        for j, title in enumerate(upserts['title']):
+            pos = positions.get(title)
+            if pos is not None and pos not in deleted:
+                source[new_pos_of_old[pos]] = n_old + j
+                replaced.append(int(new_pos_of_old[pos]))
+            else:
+                source.append(n_old + j)
+        appended = list(range(len(source) - (len(upserts) - len(replaced)), len(source)))
+        source = np.array(source, dtype=np.int64)
+
+        self.movies_data = pd.concat([old, upserts], ignore_index=True).iloc[source].reset_index(drop=True)
+        self._track_drift(upserts)
+        if self.drift() > self.drift_threshold:
+            self.refit()
+            return np.arange(len(self.movies_data))
+
+        if len(upserts):
+            matrix = vstack([self.similarity.matrix, self.pipeline.transform(upserts)]).tocsr()[source]
+        else:
+            matrix = self.similarity.matrix[source]  # Deletes only: nothing to vectorize
+        changed = np.array(sorted(set(replaced + appended)), dtype=np.int64)
+        self._update_neighbours(matrix, source, new_pos_of_old, changed)
+        return changed
+
+    def refit(self):
+        self.pipeline, self.similarity = build_model(self.movies_data, field_weights=self.pipeline.weights)
+        self.tokens_seen = self.tokens_unseen = 0
+        self.refitted = True
+
+    def save(self, csv_path='movies.csv', artifact_dir=ARTIFACT_DIR):
+        self.movies_data.to_csv(csv_path, index=False)
+        extra = {'tokens_seen': self.tokens_seen, 'tokens_unseen': self.tokens_unseen}
+        return save_artifact(artifact_dir, self.pipeline, self.similarity,
+                             self.movies_data['title'].tolist(), csv_hash(csv_path), extra,
+                             catalog=Catalog.from_frame(self.movies_data))
+
+    def _track_drift(self, upserts):
+        for field in SELECTED_FEATURES:
+            vectorizer = self.pipeline.vectorizers[field]
+            analyzer = vectorizer.build_analyzer()
+            known = vectorizer.vocabulary_
+            if vectorizer.ngram_range != (1, 1):
+                # Count words, not word pairs, so known names in a new order are not drift
+                preprocess, tokenize = vectorizer.build_preprocessor(), vectorizer.build_tokenizer()
+                analyzer = lambda document: tokenize(preprocess(document))
+                known = {word for token in known for word in token.split()}
+            for document in upserts[field]:
+                tokens = analyzer(document)
+                self.tokens_seen += len(tokens)
+                self.tokens_unseen += sum(1 for token in tokens if token not in known)
+
+    def _update_neighbours(self, matrix, source, new_pos_of_old, changed):
+        old_ids = self.similarity.neighbour_ids
+        old_scores = self.similarity.neighbour_scores
+        n_old = len(new_pos_of_old)
+        n = matrix.shape[0]
+        k = old_ids.shape[1] if old_ids is not None else NEIGHBOURS_K
+        k = max(0, min(k, n - 1))
+
+        # Carry over surviving rows' lists, remapped to new positions (deleted ids become -1)
+        ids = np.full((n, k), -1, dtype=np.int32)
+        scores = np.zeros((n, k), dtype=np.float32)
+        carried = np.flatnonzero(source < n_old)
+        if old_ids is not None and len(carried):
+            kept = min(k, old_ids.shape[1])
+            previous = np.asarray(old_ids[source[carried], :kept])
+            remapped = np.where(previous >= 0, new_pos_of_old[np.maximum(previous, 0)], -1)
+            ids[carried, :kept] = remapped
+            scores[carried, :kept] = np.asarray(old_scores[source[carried], :kept])
+            # Lists that lost a neighbour or point at a changed movie are rescored from scratch
+            lost = (previous >= 0) & (remapped < 0)
+            stale = lost.any(axis=1) | np.isin(ids[carried], changed).any(axis=1)
+            stale_rows = carried[stale]
+        else:
+            stale_rows = carried
+        recompute = np.union1d(changed, stale_rows).astype(np.int64)
+
+        engine = SimilarityEngine(matrix, normalized=True)
+        if len(recompute):
+            ids[recompute], scores[recompute] = engine.neighbours_for(recompute, k)
+
+        # Offer each changed movie to every other row whose k-th neighbour it beats
+        if len(changed) and k:
+            in_recompute = np.zeros(n, dtype=bool)
+            in_recompute[recompute] = True
+            for start in range(0, len(changed), 256):
+                batch = changed[start:start + 256]
+                block = (matrix @ matrix[batch].T).toarray()
+                block[batch, np.arange(len(batch))] = -np.inf
+                kth = np.where(ids[:, -1] >= 0, scores[:, -1], -np.inf)
+                rows = np.flatnonzero(~in_recompute & (block.max(axis=1) > kth))
+                for row in rows:
+                    candidate_ids = np.concatenate([ids[row][ids[row] >= 0], batch.astype(np.int32)])
+                    candidate_scores = np.concatenate([scores[row][ids[row] >= 0], block[row]])
+                    order = np.lexsort((candidate_ids, -candidate_scores))[:k]
+                    order = order[np.isfinite(candidate_scores[order])]
+                    ids[row] = -1
+                    scores[row] = 0
+                    ids[row, :len(order)] = candidate_ids[order]
+                    scores[row, :len(order)] = candidate_scores[order]
+
+        engine.neighbour_ids = ids
+        engine.neighbour_scores = scores
+        engine.fields = self.pipeline.layout(matrix)
+        self.similarity = engine
+
+
+def neighbour_mismatches(similarity):
+    """Rows whose neighbour scores differ from a full build_neighbours() on the same matrix."""
+    if similarity.neighbour_ids is None:
+        return np.array([], dtype=np.int64)
+    rebuilt = SimilarityEngine(similarity.matrix, normalized=True)
+    _, scores = rebuilt.build_neighbours(k=similarity.neighbour_ids.shape[1])
+    # Scores, not ids: rows tied at the k-th score may be listed in either order
+    return np.flatnonzero(~np.isclose(scores, similarity.neighbour_scores, atol=1e-5).all(axis=1))
+
+
+def load_updater(csv_path='movies.csv', artifact_dir=ARTIFACT_DIR):
+    """Updater over the current catalog, from the artifact when fresh, else a full fit."""
+    movies_data = prepare_movies(pd.read_csv(csv_path))
+    artifact = load_artifact(artifact_dir, csv_path)
+    if artifact is None:
+        pipeline, similarity = build_model(movies_data)
+        return CatalogUpdater(movies_data, pipeline, similarity)
+    manifest = artifact['manifest']
+    return CatalogUpdater(
+        movies_data, load_pipeline(artifact_dir), artifact['similarity'],
+        manifest.get('tokens_seen', 0), manifest.get('tokens_unseen', 0),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--upserts', help='CSV of new or changed movies (same columns as movies.csv)')
+    parser.add_argument('--deletes', help='text file with one title to delete per line')
+    parser.add_argument('--csv', default='movies.csv')
+    parser.add_argument('--artifact', default=ARTIFACT_DIR)
+    parser.add_argument('--drift-threshold', type=float, default=DRIFT_THRESHOLD)
+    parser.add_argument('--verify', action='store_true',
+                        help='check the patched neighbour table against a full rebuild before saving')
+    args = parser.parse_args()
+
+    updater = load_updater(args.csv, args.artifact)
+    updater.drift_threshold = args.drift_threshold
+    upserts = pd.read_csv(args.upserts) if args.upserts else None
+    deletes = []
+    if args.deletes:
+        with open(args.deletes) as f:
+            deletes = [line.strip() for line in f if line.strip()]
+
+    changed = updater.apply(upserts, deletes)
+    if args.verify:
+        mismatched = neighbour_mismatches(updater.similarity)
+        if len(mismatched):
+            parser.exit(1, f"{len(mismatched)} neighbour lists differ from a full rebuild "
+                           f"(rows {mismatched[:10].tolist()}); nothing saved\n")
+    updater.save(args.csv, args.artifact)
+    mode = 'full refit' if updater.refitted else 'incremental'
+    print(f"{mode}: {len(changed)} changed rows, {len(updater.movies_data)} movies, drift {updater.drift():.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Offline ranking-quality evaluation of engine configurations.
+
+    python evaluate.py [movies.csv] [--configs exact float64 neighbours ann:4 ann:16 vocab:0.5]
+                       [--relevance director] [--min-shared 1] [--keep-field]
+                       [--queries 500] [--k 10] [--out evaluation.json]
+
+Relevance comes from the catalog itself: for a query movie, the relevant
+movies are the others sharing its director (or at least `--min-shared`
+cast tokens or keywords). That field is held out of the model, with weight
+0, unless --keep-field is given. Otherwise every config would find those
+pairs through the field itself.
+
+Cast tokens are the model's own: adjacent word pairs, since the CSV joins
+names with spaces. A shared actor shows up as a shared pair ("zoe
+saldana"), but so do two actors listed next to each other in the same
+order ("saldana sigourney"), so cast relevance is approximate.
+
+Each config is run on the same sampled queries. The report gives, per config:
+
+- recall@k and NDCG@k against the held-out pairs
+- overlap@k with the exact float32 TF-IDF cosine baseline
+- p50/p99 per-query latency, and the memory of the config's index structures
+
+Configs:
+
+    exact        sparse float32 scoring of the whole catalog (the baseline)
+    float64      the same, on a float64 copy of the matrix
+    neighbours   lookups in the precomputed top-k neighbour table
+    ann:P        IVF index (ann.py) probing P lists
+    vocab:F      only the F most frequent terms (F <= 1 is a share of the vocabulary)
+
+Ship an optimisation with its line from this report.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+from ann import fit_ann
+from artifact import NEIGHBOURS_K, build_model, prepare_movies
+from features import FIELD_WEIGHTS, SELECTED_FEATURES, make_vectorizer
+from instrumentation import latency_summary, peak_rss_mb
+from similarity import SimilarityEngine
+
+CONFIG_NAMES = ('exact', 'float64', 'neighbours', 'ann', 'vocab')
+DEFAULT_CONFIGS = ['exact', 'float64', 'neighbours', 'ann:4', 'ann:16', 'vocab:0.5']
+
+
+def relevance_matrix(movies_data, field):
+    """Binary (rows, tokens) matrix of the field's model tokens (whole names for director, word pairs for cast)."""
+    analyzer = make_vectorizer(field).build_analyzer()
+    return CountVectorizer(analyzer=analyzer, binary=True, dtype=np.int32).fit_transform(movies_data[field]).tocsr()
+
+
+def held_out_pairs(tokens, queries, min_shared=1, seed=0):
+    """{query row: relevant rows} for up to `queries` movies with at least one relevant movie."""
+    rng = np.random.default_rng(seed)
+    pairs = {}
+    for row in rng.permutation(tokens.shape[0]):
+        shared = (tokens @ tokens[row].T).toarray().ravel()
+        shared[row] = 0
+        relevant = np.flatnonzero(shared >= min_shared)
+        if len(relevant):
+            pairs[int(row)] = set(relevant.tolist())
+            if len(pairs) == queries:
+                break
+    return pairs
+
+
+def ndcg(ranked, relevant, k):
+    gains = [1.0 / np.log2(i + 2) for i, row in enumerate(ranked[:k]) if row in relevant]
+    ideal = sum(1.0 / np.log2(i + 2) for i in range(min(k, len(relevant))))
+    return sum(gains) / ideal
+
+
+def make_engine(baseline, config, k):
+    """(engine, added index bytes) for one config string, built from the baseline engine."""
+    name, _, value = config.partition(':')
+    if name == 'exact':
+        return baseline, 0
+    if name == 'float64':
+        engine = SimilarityEngine(baseline.matrix, normalized=True)
+        engine.matrix = baseline.matrix.astype(np.float64)  # Set after: the constructor casts to float32
+        return engine, _matrix_bytes(engine.matrix) - _matrix_bytes(baseline.matrix)
+    if name == 'neighbours':
+        engine = SimilarityEngine(baseline.matrix, normalized=True)
+        engine.build_neighbours(k=max(k, NEIGHBOURS_K))
+        return engine, engine.neighbour_ids.nbytes + engine.neighbour_scores.nbytes
+    if name == 'ann':
+        engine = SimilarityEngine(baseline.matrix, normalized=True)
+        engine.ann = fit_ann(baseline, probes=int(value or 8))
+        ann = engine.ann
+        return engine, ann.components.nbytes + ann.centroids.nbytes + ann.list_offsets.nbytes + ann.list_rows.nbytes
+    if name == 'vocab':
+        share = float(value or 0.5)
+        matrix = baseline.matrix
+        frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+        keep = int(share * matrix.shape[1]) if share <= 1 else int(share)
+        columns = np.sort(np.argsort(-frequency, kind='stable')[:max(1, keep)])
+        engine = SimilarityEngine(normalize(matrix[:, columns]), normalized=True)
+        return engine, _matrix_bytes(engine.matrix) - _matrix_bytes(matrix)
+    raise ValueError(f"unknown config {config!r}")
+
+
+def evaluate_config(engine, pairs, baseline_top, k):
+    recalls, ndcgs, overlaps, samples = [], [], [], []
+    for row, relevant in pairs.items():
+        start = time.perf_counter()
+        ranked = [r for r, _ in engine.recommend([row], k)]
+        samples.append(time.perf_counter() - start)
+        hits = sum(1 for r in ranked if r in relevant)
+        recalls.append(hits / min(k, len(relevant)))
+        ndcgs.append(ndcg(ranked, relevant, k))
+        overlaps.append(len(set(ranked) & baseline_top[row]) / max(1, len(baseline_top[row])))
+    return {
+        f'recall@{k}': round(float(np.mean(recalls)), 4),
+        f'ndcg@{k}': round(float(np.mean(ndcgs)), 4),
+        f'overlap@{k}': round(float(np.mean(overlaps)), 4),
+        **latency_summary(samples),
+    }
+
+
+def run(csv_path, configs=DEFAULT_CONFIGS, relevance='director', min_shared=1, keep_field=False,
+        queries=500, k=10, seed=0):
+    """Fit the model once, then measure every config on the same held-out pairs."""
+    movies_data = prepare_movies(pd.read_csv(csv_path, usecols=lambda c: c in ['title'] + SELECTED_FEATURES))
+    weights = dict(FIELD_WEIGHTS)
+    if not keep_field:
+        weights[relevance] = 0.0
+    start = time.perf_counter()
+    _, baseline = build_model(movies_data, neighbours_k=0, field_weights=weights)
+    report = {
+        'csv': csv_path,
+        'rows': len(baseline),
+        'relevance': relevance,
+        'min_shared': min_shared,
+        'held_out': not keep_field,
+        'model_fit_s': round(time.perf_counter() - start, 3),
+        'configs': {},
+    }
+    pairs = held_out_pairs(relevance_matrix(movies_data, relevance), queries, min_shared, seed)
+    del movies_data
+    report['queries'] = len(pairs)
+    report['mean_relevant'] = round(float(np.mean([len(r) for r in pairs.values()])), 1) if pairs else 0.0
+    baseline_top = {row: {r for r, _ in baseline.recommend([row], k)} for row in pairs}
+
+    for config in configs:
+        start = time.perf_counter()
+        engine, added_bytes = make_engine(baseline, config, k)
+        build_s = time.perf_counter() - start
+        report['configs'][config] = {
+            **evaluate_config(engine, pairs, baseline_top, k),
+            'build_s': round(build_s, 3),
+            'index_mb': round((_matrix_bytes(baseline.matrix) + added_bytes) / 2 ** 20, 2),
+        }
+        del engine
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def _matrix_bytes(matrix):
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('csv', nargs='?', default='movies.csv')
+    parser.add_argument('--configs', nargs='+', default=DEFAULT_CONFIGS)
+    parser.add_argument('--relevance', choices=['director', 'cast', 'keywords'], default='director')
+    parser.add_argument('--min-shared', type=int, default=1, help='shared tokens (cast word pairs, keywords) for a relevant pair')
+    parser.add_argument('--keep-field', action='store_true', help='do not hold the relevance field out of the model')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--out', help='also write the report to this JSON file')
+    args = parser.parse_args()
+    unknown = [config for config in args.configs if config.partition(':')[0] not in CONFIG_NAMES]
+    if unknown:
+        parser.error(f"unknown configs: {', '.join(unknown)} (choose from {', '.join(CONFIG_NAMES)})")
+
+    report = run(args.csv, args.configs, args.relevance, args.min_shared, args.keep_field, args.queries, args.k)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
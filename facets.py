@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+
+def genre_key(genre_string):
+    """Canonical genre-set label: the genres sorted and joined with spaces."""
+    return ' '.join(sorted(genre_string.split(', ')))
+
+
+class FacetIndex:
+    """Posting lists for the Categories filters, built once per catalog or mapped from the artifact.
+
+    Every posting list is a sorted int32 array of row positions, so filter
+    combinations resolve by intersecting a few arrays and keep catalog order.
+    """
+
+    def __init__(self, catalog, arrays=None):
+        self.size = len(catalog)
+
+        # Catalog genre strings mapped to canonical genre sets (a short list, so rebuilt cheaply)
+        keys = [genre_key(g) if g else '' for g in catalog.genre_values]
+        set_codes, uniques = pd.factorize(pd.Series(keys), sort=True)
+        self.genre_sets = list(uniques)
+        self.genre_options = [key for key in self.genre_sets if key]
+        self.director_options = [name for name in catalog.director_values if name]
+
+        # The per-movie arrays are built here, or passed in memory-mapped from the artifact
+        if arrays is None:
+            arrays = _build_arrays(catalog, set_codes.astype(np.int32), len(self.genre_sets))
+        self.arrays = arrays
+        self.genre_rows = dict(zip(self.genre_sets, _split(arrays['genre_rows'], arrays['genre_bounds'])))
+        self.director_rows = dict(zip(catalog.director_values,
+                                      _split(arrays['director_rows'], arrays['director_bounds'])))
+        # Rows sorted by release year (-1 when unknown) for range queries
+        self.rows_by_year = arrays['rows_by_year']
+        self.sorted_years = arrays['sorted_years']
+
+    def year_rows(self, start_year, end_year):
+        lo = np.searchsorted(self.sorted_years, start_year, side='left')
+        hi = np.searchsorted(self.sorted_years, end_year, side='right')
+        return np.sort(self.rows_by_year[lo:hi])
+
+    def filter(self, genre=None, director=None, year_range=None):
+        """Row positions matching every given facet, in catalog order."""
+        empty = np.empty(0, dtype=np.int32)
+        postings = []
+        if genre:
+            postings.append(self.genre_rows.get(genre, empty))
+        if director:
+            postings.append(self.director_rows.get(director, empty))
+        if year_range:
+            postings.append(self.year_rows(*year_range))
+        if not postings:
+            return np.arange(self.size, dtype=np.int32)
+
+        postings.sort(key=len)  # Intersect smallest first
+        rows = postings[0]
+        for other in postings[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+
+def _build_arrays(catalog, set_codes, set_count):
+    genre_rows, genre_bounds = _postings(set_codes[catalog.genre_codes], set_count)
+    director_rows, director_bounds = _postings(catalog.director_codes.astype(np.int32), len(catalog.director_values))
+    rows_by_year = np.argsort(catalog.years, kind='stable').astype(np.int32)
+    return {
+        'genre_rows': genre_rows,
+        'genre_bounds': genre_bounds,
+        'director_rows': director_rows,
+        'director_bounds': director_bounds,
+        'rows_by_year': rows_by_year,
+        'sorted_years': catalog.years[rows_by_year],
+    }
+
+
+def _postings(codes, count):
+    # Rows grouped by code (catalog order within each group) plus each group's bounds
+    order = np.argsort(codes, kind='stable').astype(np.int32)
+    bounds = np.searchsorted(codes[order], np.arange(count + 1)).astype(np.int64)
+    return order, bounds
+
+
+def _split(rows, bounds):
+    return [rows[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
@@ -0,0 +1,158 @@
+"""Per-field TF-IDF feature pipeline with runtime field weights.
+
+Each of SELECTED_FEATURES gets its own TfidfVectorizer and tokenizer, so a
+director's name is never counted as a tagline word:
+
+- genres, keywords: words
+- tagline: words without English stop words
+- cast: adjacent word pairs, so "Zoe Saldana" is one token and never
+  matches another Zoe (the CSV joins names with spaces, not separators)
+- director: the whole name as one token
+
+Each field's rows are L2-normalized into a block, the block is scaled by
+the square root of its default weight, and the blocks are laid side by
+side and row-normalized. That single matrix is what the engine, the
+neighbour table and the ANN index use, and field f is the column range
+`offsets[f]:offsets[f + 1]` of it, so each field is vectorized and stored
+once.
+
+Other weights are applied at query time without refitting or copying the
+matrix (see FieldLayout): the query is rescaled per field and the scores
+are divided by each row's norm under the new weights, which comes from a
+small (rows, fields) table of per-field squared norms.
+"""
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+SELECTED_FEATURES = ['genres', 'keywords', 'tagline', 'cast', 'director']
+FIELD_WEIGHTS = {'genres': 1.0, 'keywords': 1.0, 'tagline': 0.5, 'cast': 1.0, 'director': 1.0}
+
+
+def _whole_name(text):
+    text = ' '.join(text.lower().split())
+    return [text] if text else []
+
+
+FIELD_VECTORIZERS = {
+    'genres': {},
+    'keywords': {},
+    'tagline': {'stop_words': 'english'},
+    'cast': {'ngram_range': (2, 2)},
+    'director': {'analyzer': _whole_name},
+}
+
+
+def make_vectorizer(field, vocabulary=None, idf=None):
+    """The field's TfidfVectorizer, already fitted when a vocabulary and idf weights are given."""
+    vectorizer = TfidfVectorizer(vocabulary=vocabulary, dtype=np.float32, **FIELD_VECTORIZERS[field])
+    if idf is not None:
+        vectorizer.idf_ = np.asarray(idf, dtype=np.float32)
+    return vectorizer
+
+
+class FeaturePipeline:
+    """One fitted vectorizer per field plus the default weights the engine matrix is built with."""
+
+    def __init__(self, vectorizers, weights=None):
+        self.vectorizers = vectorizers  # field -> fitted TfidfVectorizer, in column order
+        self.weights = {field: float((weights or FIELD_WEIGHTS)[field]) for field in vectorizers}
+
+    @property
+    def fields(self):
+        return list(self.vectorizers)
+
+    @property
+    def offsets(self):
+        sizes = [len(vectorizer.vocabulary_) for vectorizer in self.vectorizers.values()]
+        return np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+    @classmethod
+    def fit(cls, movies_data, weights=None):
+        vectorizers = {field: make_vectorizer(field) for field in SELECTED_FEATURES}
+        for field, vectorizer in vectorizers.items():
+            vectorizer.fit(movies_data[field])
+        return cls(vectorizers, weights)
+
+    def transform(self, movies_data):
+        """Unit-length rows of the weighted field blocks laid side by side (float32 CSR)."""
+        blocks = [self.vectorizers[field].transform(movies_data[field]) * np.float32(np.sqrt(self.weights[field]))
+                  for field in self.vectorizers]
+        matrix = normalize(hstack(blocks, format='csr', dtype=np.float32))
+        matrix.eliminate_zeros()  # A field weighted 0 stores nothing
+        return matrix
+
+    def layout(self, matrix):
+        return FieldLayout(self.fields, self.offsets, self.weights, field_mass(matrix, self.offsets))
+
+    @property
+    def idf(self):
+        return np.concatenate([vectorizer.idf_ for vectorizer in self.vectorizers.values()]).astype(np.float32)
+
+    @classmethod
+    def from_vocabularies(cls, vocabularies, idf, weights=None):
+        """Fitted pipeline from {field: vocabulary} in column order and the idf of every column."""
+        vectorizers = {}
+        start = 0
+        for field, vocabulary in vocabularies.items():
+            vectorizers[field] = make_vectorizer(field, vocabulary, idf[start:start + len(vocabulary)])
+            start += len(vocabulary)
+        return cls(vectorizers, weights)
+
+
+class FieldLayout:
+    """Where each field sits in the engine matrix, and each row's squared norm per field.
+
+    With default weights w0 and new weights w, let r = w / w0 per field. The
+    cosine under w of a query q and row x is (q scaled by r) . x divided by
+    sqrt(mass[q] @ r) * sqrt(mass[x] @ r), so one sparse product against the
+    unchanged matrix scores the whole catalog.
+    """
+
+    def __init__(self, fields, offsets, weights, mass):
+        self.fields = list(fields)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.weights = {field: float(weights[field]) for field in self.fields}
+        self.mass = mass  # (rows, fields) float32
+
+    def ratios(self, field_weights):
+        """r per field for a {field: weight} override; missing fields keep their default weight."""
+        unknown = set(field_weights) - set(self.fields)
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+        ratios = [float(field_weights.get(field, weight)) / weight if weight else 0.0
+                  for field, weight in self.weights.items()]
+        if not np.all(np.isfinite(ratios)):
+            raise ValueError("field weights must be finite numbers")
+        if min(ratios) < 0:
+            raise ValueError("field weights must not be negative")
+        if max(ratios) == 0:
+            raise ValueError("at least one field weight must be positive")
+        return np.asarray(ratios, dtype=np.float32)
+
+    def scale(self, vectors, factors):
+        """Copy of CSR `vectors` with every column multiplied by its field's factor."""
+        vectors = csr_matrix(vectors, dtype=np.float32, copy=True)
+        field_of = np.searchsorted(self.offsets, vectors.indices, side='right') - 1
+        vectors.data *= np.asarray(factors, dtype=np.float32)[field_of]
+        return vectors
+
+    def row_norms(self, ratios, rows=None):
+        mass = self.mass if rows is None else self.mass[rows]
+        return np.sqrt(np.maximum(np.asarray(mass, dtype=np.float32) @ ratios, 0))
+
+
+def field_mass(matrix, offsets):
+    """(rows, fields) sums of squared values per field, from the CSR matrix alone."""
+    n, fields = matrix.shape[0], len(offsets) - 1
+    mass = np.zeros((n, fields), dtype=np.float32)
+    for start in range(0, n, 65536):  # Bounded temporaries on large memory-mapped matrices
+        part = matrix[start:start + 65536]
+        rows = part.shape[0]
+        row_of = np.repeat(np.arange(rows), np.diff(part.indptr))
+        field_of = np.searchsorted(offsets, part.indices, side='right') - 1
+        sums = np.bincount(row_of * fields + field_of, weights=np.square(part.data, dtype=np.float64),
+                           minlength=rows * fields)
+        mass[start:start + rows] = sums.reshape(rows, fields)
+    return mass
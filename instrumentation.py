@@ -0,0 +1,177 @@
+"""Timing spans and counters for the hot paths.
+
+`span(name)` times a block and `incr(name)` bumps a counter. Both feed the
+process-wide `metrics` registry (exported as Prometheus text by
+`metrics.prometheus_text()`) and, when one is active, the current `Trace`,
+which collects the breakdown for a single Streamlit rerun or HTTP request.
+The active trace is held in a context variable; use `map_in_context()` or
+`submit_in_context()` to keep it when fanning work out to a thread pool.
+
+`latency_summary()` and `peak_rss_mb()` are the shared report helpers of
+the offline tools (benchmark.py, evaluate.py, ann.py evaluate).
+"""
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'movie_recommender'
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+class Metrics:
+    """Process-wide counters and span latency histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.spans = {}  # name -> [count, total seconds, per-bucket counts]
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, name, seconds):
+        with self._lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                entry = self.spans[name] = [0, 0.0, [0] * len(BUCKETS)]
+            entry[0] += 1
+            entry[1] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[2][i] += 1
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f'{METRIC_PREFIX}_{name}_total'
+                lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+            if self.spans:
+                metric = f'{METRIC_PREFIX}_span_seconds'
+                lines.append(f'# TYPE {metric} histogram')
+            for name, (count, total, buckets) in sorted(self.spans.items()):
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    lines.append(f'{metric}_bucket{{span="{name}",le="{bound}"}} {bucket_count}')
+                lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {count}')
+                lines.append(f'{metric}_sum{{span="{name}"}} {total:.6f}')
+                lines.append(f'{metric}_count{{span="{name}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class Trace:
+    """Spans and counters recorded during one rerun or request."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []  # (name, seconds) in completion order
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            self.spans.append((name, seconds))
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def summary(self):
+        """Total time and call count per span name, slowest first."""
+        totals = {}
+        for name, seconds in self.spans:
+            total, calls = totals.get(name, (0.0, 0))
+            totals[name] = (total + seconds, calls + 1)
+        return sorted(((name, total, calls) for name, (total, calls) in totals.items()), key=lambda x: -x[1])
+
+    def as_dict(self):
+        return {
+            'trace': self.name,
+            'total_ms': round(self.elapsed() * 1000, 3),
+            'spans': {name: {'ms': round(total * 1000, 3), 'calls': calls} for name, total, calls in self.summary()},
+            'counters': dict(self.counters),
+        }
+
+
+def start_trace(name):
+    """Make a new trace current for this context and return it."""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe(name, elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, elapsed)
+
+
+def incr(name, n=1):
+    metrics.incr(name, n)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.incr(name, n)
+
+
+def map_in_context(executor, func, items):
+    """executor.map that runs each call in a copy of the caller's context (keeps the trace)."""
+    contexts = [contextvars.copy_context() for _ in items]
+    return executor.map(lambda pair: pair[0].run(func, pair[1]), zip(contexts, items))
+
+
+def submit_in_context(executor, func, *args):
+    """executor.submit that runs the call in a copy of the caller's context (keeps the trace)."""
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+def log_trace(trace, level=logging.INFO):
+    """Emit the trace as one structured JSON log line."""
+    logger.log(level, json.dumps(trace.as_dict()))
+
+
+def latency_summary(samples):
+    """count, p50, p99 and mean in milliseconds of per-call durations given in seconds."""
+    samples = np.asarray(samples) * 1000
+    return {
+        'count': int(len(samples)),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+    }
+
+
+def peak_rss_mb():
+    import resource  # Unix only; the app imports this module on any platform
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
@@ -0,0 +1,153 @@
+"""Two-tier TTL cache for TMDB movie metadata.
+
+Lookups hit a bounded in-process LRU first, then a local SQLite table shared
+by every worker process on the host. Entries expire after `ttl` seconds;
+negative results ("no match on TMDB") are cached too, with a shorter TTL.
+Details are keyed by TMDB id when the catalog has one, so movies sharing a
+title (remakes) each get their own poster and rating; by title otherwise.
+
+The same database keeps the title -> TMDB id mapping resolved by searches,
+without expiry, so each title is searched at most once.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import incr
+
+MISSING = object()  # Returned by get() when a key is not cached (None is a cached "no match")
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+
+
+def normalize_key(title):
+    """Case- and whitespace-insensitive cache key for a title."""
+    return re.sub(r'\s+', ' ', str(title)).strip().lower()
+
+
+def details_key(title, tmdb_id=None):
+    """Cache key for one movie's details: its TMDB id when known, else the normalized title."""
+    if tmdb_id is not None:
+        return f'id:{int(tmdb_id)}'
+    return normalize_key(title)
+
+
+class MetadataCache:
+    def __init__(self, path, max_entries=2048, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0}
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._ids = {}  # key -> TMDB id
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)'
+            )
+            self._db.execute('CREATE TABLE IF NOT EXISTS tmdb_ids (key TEXT PRIMARY KEY, tmdb_id INTEGER)')
+            self._db.commit()
+
+    def get(self, title, tmdb_id=None):
+        key = details_key(title, tmdb_id)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._count('memory_hits')
+                    return entry[1]
+                self._count('expired')  # Kept for get_stale() until set() or LRU eviction replaces it
+
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT value, expires_at FROM metadata WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self._count('disk_hits')
+                    return value
+                if row is not None:
+                    self._count('expired')
+
+            self._count('misses')
+            return MISSING
+
+    def get_stale(self, title, tmdb_id=None):
+        """Cached value for the movie even if expired (for when TMDB is down), else MISSING."""
+        key = details_key(title, tmdb_id)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                return entry[1]
+            if self._db is not None:
+                row = self._db.execute('SELECT value FROM metadata WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    return json.loads(row[0])
+        return MISSING
+
+    def set(self, title, value, tmdb_id=None):
+        """Cache `value` for the movie; pass None to record a negative result."""
+        key = details_key(title, tmdb_id)
+        expires_at = time.time() + (self.ttl if value is not None else self.negative_ttl)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO metadata (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), expires_at),
+                )
+                self._db.commit()
+
+    def get_id(self, title):
+        """TMDB id previously resolved for `title`, or None."""
+        key = normalize_key(title)
+        with self._lock:
+            tmdb_id = self._ids.get(key)
+            if tmdb_id is None and self._db is not None:
+                row = self._db.execute('SELECT tmdb_id FROM tmdb_ids WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    tmdb_id = self._ids[key] = row[0]
+            return tmdb_id
+
+    def set_id(self, title, tmdb_id):
+        key = normalize_key(title)
+        with self._lock:
+            self._ids[key] = tmdb_id
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO tmdb_ids (key, tmdb_id) VALUES (?, ?)', (key, tmdb_id))
+                self._db.commit()
+
+    def purge_expired(self):
+        """Delete expired rows from the disk tier."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            deleted = self._db.execute('DELETE FROM metadata WHERE expires_at <= ?', (time.time(),)).rowcount
+            self._db.commit()
+            return deleted
+
+    def hit_rate(self):
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+    def _count(self, kind):
+        self.stats[kind] += 1
+        incr(f'metadata_cache_{kind}')
+
+    def _remember(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
@@ -0,0 +1,56 @@
+"""Local columnar store of prefetched TMDB metadata (written by prefetch.py).
+
+The store is a directory of Parquet part files, one per checkpoint. Each row
+is one movie, keyed like the metadata cache (TMDB id when known, else the
+normalized title); `found` is False for movies TMDB had no match for.
+"""
+import glob
+import os
+import time
+
+import pandas as pd
+
+from metadata_cache import details_key
+
+STORE_DIR = os.environ.get('TMDB_METADATA_STORE', 'metadata_store')
+DETAIL_COLUMNS = ['title', 'poster', 'release_date', 'trailer', 'rating']
+COLUMNS = ['key', 'found', 'fetched_at'] + DETAIL_COLUMNS
+
+
+def read_store(store_dir=STORE_DIR):
+    """Read every part file into one DataFrame (empty if the store does not exist)."""
+    parts = sorted(glob.glob(os.path.join(store_dir, 'part-*.parquet')))
+    if not parts:
+        return pd.DataFrame(columns=COLUMNS)
+    store = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+    # Later parts win when a title was fetched more than once
+    return store.drop_duplicates('key', keep='last')
+
+
+def write_part(store_dir, results):
+    """Append one checkpoint of (title, tmdb_id-or-None, details-or-None) triples as a new part file."""
+    os.makedirs(store_dir, exist_ok=True)
+    now = time.time()
+    rows = []
+    for title, tmdb_id, details in results:
+        row = {'key': details_key(title, tmdb_id), 'found': details is not None, 'fetched_at': now}
+        for column in DETAIL_COLUMNS:
+            row[column] = details.get(column) if details else None
+        rows.append(row)
+    part_number = len(glob.glob(os.path.join(store_dir, 'part-*.parquet')))
+    path = os.path.join(store_dir, f'part-{part_number:05d}.parquet')
+    tmp_path = path + '.tmp'
+    frame = pd.DataFrame(rows, columns=COLUMNS)
+    frame['rating'] = pd.to_numeric(frame['rating'])
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_lookup(store_dir=STORE_DIR):
+    """Return {details_key: details dict or None} for serving, or {} without a store."""
+    store = read_store(store_dir)
+    lookup = {}
+    for row in store.itertuples(index=False):
+        lookup[row.key] = {column: getattr(row, column) for column in DETAIL_COLUMNS} if row.found else None
+    return lookup
@@ -0,0 +1,124 @@
+"""Local stand-in for the TMDB API, for benchmarks and offline runs.
+
+    python mock_tmdb.py [--port 8765] [--latency-ms 20] [--failure-rate 0.1] [--throttle-rate 0.1]
+
+Then point the app or prefetch.py at it with
+TMDB_BASE_URL=http://127.0.0.1:8765/3. Responses are deterministic per
+title; about 1 in 20 titles has no search match. --failure-rate and
+--throttle-rate make that fraction of requests answer 503, or 429 with
+Retry-After, to exercise retries and the circuit breaker.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _movie_id(title):
+    return zlib.crc32(title.encode()) % 1_000_000 + 1
+
+
+def make_mock_server(host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, throttle_rate=0.0, seed=0):
+    """Return a mock TMDB server (not started); `latency` is seconds added to every response."""
+    counts = {'requests': 0, 'failed': 0, 'throttled': 0}
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def videos(movie_id):
+        return {'id': movie_id, 'results': [{'type': 'Trailer', 'site': 'YouTube', 'key': f'trailer{movie_id}'}]}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # Keep-alive like service.Handler (see the note there)
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                counts['requests'] += 1
+                draw = rng.random()
+                outcome = None
+                if draw < failure_rate:
+                    outcome = 'failed'
+                elif draw < failure_rate + throttle_rate:
+                    outcome = 'throttled'
+                if outcome:
+                    counts[outcome] += 1
+            if latency:
+                time.sleep(latency)
+            if outcome == 'failed':
+                return self._send(503, {'status_message': 'Service unavailable.'})
+            if outcome == 'throttled':
+                return self._send(429, {'status_message': 'Too many requests.'}, {'Retry-After': '1'})
+            url = urlparse(self.path)
+            params = {name: values[0] for name, values in parse_qs(url.query).items()}
+            parts = url.path.strip('/').split('/')
+
+            if parts[-2:] == ['search', 'movie']:
+                title = params.get('query', '')
+                movie_id = _movie_id(title)
+                results = [] if movie_id % 20 == 0 else [{'id': movie_id, 'title': title}]
+                return self._send(200, {'page': 1, 'results': results})
+            if len(parts) >= 2 and parts[-2] == 'movie' and parts[-1].isdigit():
+                movie_id = int(parts[-1])
+                body = {
+                    'id': movie_id,
+                    'title': f'Movie {movie_id}',
+                    'poster_path': f'/poster{movie_id}.jpg',
+                    'release_date': f'{1950 + movie_id % 70}-01-01',
+                    'vote_average': round(movie_id % 100 / 10, 1),
+                }
+                if 'videos' in params.get('append_to_response', ''):
+                    body['videos'] = videos(movie_id)
+                return self._send(200, body)
+            if len(parts) >= 3 and parts[-1] == 'videos' and parts[-2].isdigit():
+                return self._send(200, videos(int(parts[-2])))
+            self._send(404, {'status_message': 'The resource you requested could not be found.'})
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.counts = counts
+    return server
+
+
+def start_mock_server(latency=0.0, failure_rate=0.0, throttle_rate=0.0):
+    """Start a mock server on a free port in a background thread; returns (server, base_url)."""
+    server = make_mock_server(latency=latency, failure_rate=failure_rate, throttle_rate=throttle_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f'http://{host}:{port}/3'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a mock TMDB API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = make_mock_server(args.host, args.port, args.latency_ms / 1000, args.failure_rate, args.throttle_rate)
+    print(f"Mock TMDB on http://{args.host}:{args.port}/3")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Local poster thumbnail cache.
+
+Each poster is downloaded once and shrunk to the widths the card grids
+actually draw (THUMBNAIL_WIDTHS). Thumbnails are stored content-addressed
+(the file name is the SHA-256 of the JPEG bytes) under one directory, and
+an SQLite index maps (poster URL, width) to a file and its last use. When
+the total size goes over `max_bytes` the least recently used thumbnails are
+deleted.
+
+The default directory is static/posters next to app.py, which Streamlit
+serves at app/static/posters/ (server.enableStaticServing in
+.streamlit/config.toml). Cards link to those URLs with static_url(), so the
+browser downloads each thumbnail once over HTTP and caches it, instead of
+the image going through the websocket on every rerun or every browser
+fetching the full-size poster from image.tmdb.org. The index is kept
+outside the served directory.
+"""
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+from PIL import Image
+
+from instrumentation import incr
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')  # Served at app/static/
+STATIC_URL = 'app/static'
+POSTER_CACHE_DIR = os.environ.get('TMDB_POSTER_CACHE', os.path.join(STATIC_DIR, 'posters'))
+POSTER_INDEX_PATH = os.environ.get('TMDB_POSTER_INDEX', 'poster_cache.sqlite3')
+POSTER_CACHE_BYTES = int(float(os.environ.get('TMDB_POSTER_CACHE_MB', '256')) * 1024 * 1024)
+GRID_4_WIDTH = 320  # Recommendations and Favorites (4 columns)
+GRID_5_WIDTH = 260  # Categories (5 columns)
+THUMBNAIL_WIDTHS = (GRID_4_WIDTH, GRID_5_WIDTH)
+JPEG_QUALITY = 82
+FAILURE_TTL = 300  # Seconds before a poster that failed to download is tried again
+MAX_FAILURES = 10000  # Failed URLs remembered at once; the oldest are forgotten first
+
+
+class PosterCache:
+    def __init__(self, directory=POSTER_CACHE_DIR, max_bytes=POSTER_CACHE_BYTES, timeout=(3.05, 10),
+                 index_path=POSTER_INDEX_PATH):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._failed = {}  # url -> time of the last failed download
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(index_path, check_same_thread=False, timeout=10)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS thumbnails '
+            '(url TEXT, width INTEGER, digest TEXT, size INTEGER, last_used REAL, PRIMARY KEY (url, width))'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS thumbnails_last_used ON thumbnails (last_used)')
+        self._db.commit()
+
+    def cached(self, url, width):
+        """Path of the stored thumbnail, or None without touching the network."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT digest FROM thumbnails WHERE url = ? AND width = ?', (url, width)
+            ).fetchone()
+            if row is None:
+                return None
+            path = self._path(row[0])
+            if not os.path.exists(path):  # Evicted by another worker
+                self._db.execute('DELETE FROM thumbnails WHERE url = ? AND width = ?', (url, width))
+                self._db.commit()
+                return None
+            self._db.execute(
+                'UPDATE thumbnails SET last_used = ? WHERE url = ? AND width = ?', (time.time(), url, width)
+            )
+            self._db.commit()
+        incr('poster_cache_hits')
+        return path
+
+    def thumbnail(self, url, width, session=None):
+        """Path of the `width`-pixel thumbnail for a poster URL, downloading it once; None on failure."""
+        path = self.cached(url, width)
+        if path is not None:
+            return path
+        if self._recently_failed(url):
+            return None  # Do not hold every page render on an image host that just failed
+        incr('poster_cache_misses')
+        try:
+            response = (session or requests).get(url, timeout=self.timeout)
+            response.raise_for_status()
+            image = Image.open(io.BytesIO(response.content)).convert('RGB')
+        except (requests.exceptions.RequestException, OSError) as e:
+            logger.warning("Could not cache poster %s: %s", url, e)
+            self._record_failure(url)
+            return None
+        with self._lock:
+            self._failed.pop(url, None)
+
+        # Every grid width at once, so the original is fetched a single time
+        now = time.time()
+        paths = {}
+        rows = []
+        for target in dict.fromkeys(THUMBNAIL_WIDTHS + (width,)):
+            copy = image.copy()
+            copy.thumbnail((target, target * 3), Image.LANCZOS)
+            buffer = io.BytesIO()
+            copy.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+            data = buffer.getvalue()
+            digest = hashlib.sha256(data).hexdigest()
+            paths[target] = self._write(digest, data)
+            rows.append((url, target, digest, len(data), now))
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?)', rows)
+            self._db.commit()
+            self._evict()
+        return paths[width]
+
+    def total_bytes(self):
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM thumbnails').fetchone()[0]
+
+    def _recently_failed(self, url):
+        with self._lock:
+            failed_at = self._failed.get(url)
+            if failed_at is None:
+                return False
+            if time.time() - failed_at < FAILURE_TTL:
+                return True
+            del self._failed[url]  # Expired: try the download again
+            return False
+
+    def _record_failure(self, url):
+        now = time.time()
+        with self._lock:
+            self._failed.pop(url, None)  # Re-insert so the dict stays ordered oldest first
+            self._failed[url] = now
+            while len(self._failed) > MAX_FAILURES or now - next(iter(self._failed.values())) >= FAILURE_TTL:
+                del self._failed[next(iter(self._failed))]
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], f'{digest}.jpg')
+
+    def _write(self, digest, data):
+        path = self._path(digest)
+        if not os.path.exists(path):  # Same bytes, same name: nothing to do
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return path
+
+    def _evict(self):
+        # Least recently used first, until the index is back under budget
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM thumbnails').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, width, digest, size in self._db.execute(
+            'SELECT url, width, digest, size FROM thumbnails ORDER BY last_used'
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM thumbnails WHERE url = ? AND width = ?', (url, width))
+            shared = self._db.execute('SELECT 1 FROM thumbnails WHERE digest = ? LIMIT 1', (digest,)).fetchone()
+            if shared is None:
+                try:
+                    os.remove(self._path(digest))
+                except FileNotFoundError:
+                    pass
+            total -= size
+            incr('poster_cache_evictions')
+        self._db.commit()
+
+
+def static_url(path):
+    """URL Streamlit serves a thumbnail at, or None when it is not under the static directory."""
+    relative = os.path.relpath(os.path.abspath(path), STATIC_DIR)
+    if relative.startswith(os.pardir):
+        return None
+    return f"{STATIC_URL}/{relative.replace(os.sep, '/')}"
@@ -0,0 +1,92 @@
+"""Warm the local metadata store for every title in movies.csv.
+
+    python prefetch.py [--csv movies.csv] [--store metadata_store]
+                       [--base-url URL] [--workers 8] [--rate 10]
+                       [--checkpoint-every 500]
+
+Movies are looked up concurrently with a global rate limit and written to
+the store in checkpoints, so an interrupted run resumes where it stopped.
+Rows with a TMDB id are fetched (and stored) by id, so remakes sharing a
+title each get their own details. The app serves these movies from the
+store instead of calling TMDB.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+import tmdb
+from catalog import tmdb_ids
+from metadata_cache import details_key
+from metadata_store import STORE_DIR, read_store, write_part
+from tmdb_client import TokenBucket
+
+
+def pending_movies(movies_data, store_dir):
+    """(title, tmdb_id or None) for every movie of the CSV that is not in the store yet."""
+    done = set(read_store(store_dir)['key'])
+    movies = []
+    for title, tmdb_id in zip(movies_data['title'], tmdb_ids(movies_data)):
+        if pd.isna(title):
+            continue
+        tmdb_id = int(tmdb_id) if tmdb_id >= 0 else None  # An id from the CSV skips the search request
+        key = details_key(title, tmdb_id)
+        if key not in done:
+            done.add(key)
+            movies.append((title, tmdb_id))
+    return movies
+
+
+def prefetch(csv_path='movies.csv', store_dir=STORE_DIR, workers=8, rate=10.0, checkpoint_every=500):
+    movies_data = pd.read_csv(csv_path, usecols=lambda c: c in ('title', 'id'))
+    movies = pending_movies(movies_data, store_dir)
+    print(f"{len(movies)} movies to fetch")
+
+    session = tmdb.get_session()
+    limiter = TokenBucket(rate)  # Per movie, on top of tmdb's per-request limit
+    errors = 0
+
+    def fetch(movie):
+        title, tmdb_id = movie
+        limiter.acquire()
+        try:
+            return title, tmdb_id, tmdb.lookup_movie(title, session, tmdb_id=tmdb_id), None
+        except requests.exceptions.RequestException as e:
+            return title, tmdb_id, None, e
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch') as executor:
+        for start in range(0, len(movies), checkpoint_every):
+            batch = movies[start:start + checkpoint_every]
+            results = []
+            for title, tmdb_id, details, error in executor.map(fetch, batch):
+                if error is not None:
+                    # Left out of the checkpoint so the next run retries it
+                    errors += 1
+                    print(f"  error: {title!r}: {error}")
+                    continue
+                results.append((title, tmdb_id, details))
+            if results:
+                write_part(store_dir, results)
+            print(f"{min(start + checkpoint_every, len(movies))}/{len(movies)} fetched ({errors} errors)")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', default='movies.csv')
+    parser.add_argument('--store', default=STORE_DIR)
+    parser.add_argument('--base-url', default=None, help='TMDB API base URL (e.g. a local stub server)')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=10.0, help='max title lookups per second')
+    parser.add_argument('--checkpoint-every', type=int, default=500)
+    args = parser.parse_args()
+
+    if args.base_url:
+        tmdb.BASE_URL = args.base_url.rstrip('/')
+    errors = prefetch(args.csv, args.store, args.workers, args.rate, args.checkpoint_every)
+    raise SystemExit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Title-level recommendation API over the loaded catalog.
+
+    python recommender.py seeds.jsonl recommendations.jsonl [--k 10]
+
+The CLI scores many users offline in one vectorized pass. Each input line
+is {"user": ..., "seeds": [title, ...]}; each output line is
+{"user": ..., "recommendations": [{"title": ..., "score": ...}, ...]}.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from ann import ANN_PROBES, load_ann
+from artifact import (ARTIFACT_DIR, NEIGHBOURS_K, SELECTED_FEATURES, artifact_version, build_model, load_artifact,
+                      prepare_movies)
+from catalog import SERVING_COLUMNS, Catalog
+from facets import FacetIndex
+from instrumentation import span
+from result_cache import FILTER_CACHE_BYTES, ResultCache
+from title_index import TitleIndex
+
+logger = logging.getLogger(__name__)
+
+
+class Recommender:
+    def __init__(self, catalog, similarity, title_index, facets, version=None):
+        self.catalog = catalog
+        self.similarity = similarity
+        self.title_index = title_index
+        self.facets = facets
+        self.version = version  # Artifact id of this catalog; part of every result cache key
+        # Shared by every session and request thread using this recommender
+        self.query_cache = ResultCache(name='query')
+        self.filter_cache = ResultCache(FILTER_CACHE_BYTES, weigh=lambda rows: rows.nbytes, name='filter')
+
+    def resolve(self, title):
+        """Row of the closest matching title, or None."""
+        matches = self.title_index.lookup(title, n=1)
+        return matches[0][1] if matches else None
+
+    def recommend(self, seeds, k=10, exclude=(), weights=None, field_weights=None):
+        """Top-k (title, row, score) for a list of seed titles, e.g. a favorites list.
+
+        Seeds are matched fuzzily and skipped, along with their weights, when nothing matches. `exclude`
+        titles only remove movies with exactly that title (ignoring case), never a near match. `field_weights`
+        ({field: weight}, e.g. per A/B bucket) reweights genres, keywords, tagline, cast and director.
+        """
+        seed_rows, seed_weights = self._resolve_seeds(seeds, weights)
+        if not seed_rows:
+            return []
+        exclude_rows = [row for row in map(self.title_index.exact, exclude) if row is not None]
+        ranked = self.similarity.recommend(seed_rows, k, exclude_rows, seed_weights, field_weights)
+        return self._with_titles(ranked)
+
+    def recommend_batch(self, seed_sets, k=10):
+        """recommend() for many seed lists at once; returns one result list per seed list."""
+        resolved = [self._resolve_seeds(seeds)[0] for seeds in seed_sets]
+        scored = [rows for rows in resolved if rows]
+        ranked = iter(self.similarity.recommend_batch(scored, k))
+        return [self._with_titles(next(ranked)) if rows else [] for rows in resolved]
+
+    def recommend_query(self, query, k=10, field_weights=None):
+        """Fuzzy-match a typed title and return its top-k as plain dicts, or None if nothing matches.
+
+        Results are cached per (normalized query, k, field weights, catalog version) and shared
+        between callers, so treat them as read-only.
+        """
+        weights_key = tuple(sorted(field_weights.items())) if field_weights else None
+        key = (str(query).strip().lower(), k, weights_key, self.version)  # Title matching ignores case
+        return self.query_cache.get_or_compute(key, lambda: self._recommend_query(query, k, field_weights))
+
+    def _recommend_query(self, query, k, field_weights):
+        with span('title_match'):
+            matches = self.title_index.lookup(query)
+        if not matches:
+            return None
+        title, row, _ = matches[0]
+        with span('similarity_rank'):
+            ranked = self.similarity.recommend([row], k, field_weights=field_weights)  # Excludes the input movie
+        return {'match': title, 'recommendations': [self.movie(r, similarity=score) for r, score in ranked]}
+
+    def facet_options(self):
+        return {'genres': self.facets.genre_options, 'directors': self.facets.director_options}
+
+    def filter_movies(self, genre=None, director=None, year_range=None, offset=0, limit=20):
+        """One window of the movies matching the Categories filters, plus the total count."""
+        # The full row list is cached, so every page of a popular combination is a slice
+        key = (genre or None, director or None, tuple(year_range) if year_range else None, self.version)
+        with span('facet_filter'):
+            rows = self.filter_cache.get_or_compute(
+                key, lambda: self.facets.filter(genre=genre, director=director, year_range=year_range))
+        return {'total': int(len(rows)), 'movies': [self.movie(row) for row in rows[offset:offset + limit]]}
+
+    def movie(self, row, **extra):
+        """Catalog fields for one row as a JSON-friendly dict."""
+        return {
+            'row': int(row),
+            'title': self.catalog.title(row),
+            'genres': self.catalog.genres(row),
+            'director': self.catalog.director(row),
+            'year': self.catalog.year(row),
+            'tmdb_id': self.catalog.tmdb_id(row),
+            **extra,
+        }
+
+    def _resolve_seeds(self, seeds, weights=None):
+        if weights is not None and len(weights) != len(seeds):
+            raise ValueError("weights must have one entry per seed")
+        rows, kept_weights = [], []
+        for i, title in enumerate(seeds):
+            row = self.resolve(title)
+            if row is not None:
+                rows.append(row)
+                kept_weights.append(weights[i] if weights is not None else 1.0)
+        return rows, (kept_weights if weights is not None else None)
+
+    def _with_titles(self, ranked):
+        return [(self.catalog.title(row), row, score) for row, score in ranked]
+
+
+def load_recommender(csv_path='movies.csv', artifact_dir=ARTIFACT_DIR, neighbours_k=NEIGHBOURS_K):
+    """Load the catalog and every index built on it."""
+    # Use the prebuilt artifact (python artifact.py) when it matches the CSV, else fit in-process
+    with span('artifact_load'):
+        artifact = load_artifact(artifact_dir, csv_path)
+    if artifact is not None and artifact['catalog'] is not None:
+        # Everything but the title index is attached zero-copy from the artifact's memory maps
+        similarity, catalog, facets = artifact['similarity'], artifact['catalog'], artifact['facets']
+    else:
+        with span('csv_load'):
+            columns = SERVING_COLUMNS
+            if artifact is None:
+                columns = list(dict.fromkeys(SERVING_COLUMNS + SELECTED_FEATURES))
+            movies_data = pd.read_csv(csv_path, usecols=lambda c: c in columns)
+        if artifact is not None:
+            similarity = artifact['similarity']
+        else:
+            with span('model_fit'):
+                _, similarity = build_model(prepare_movies(movies_data), neighbours_k)
+        # Only the compact catalog is kept; the frame and its raw text go out of scope here
+        catalog = Catalog.from_frame(movies_data)
+        del movies_data
+        facets = None
+    version = artifact['manifest'].get('artifact_id') if artifact is not None else None
+    if ANN_PROBES > 0:
+        if artifact is not None:
+            similarity.ann = load_ann(artifact_dir, similarity, ANN_PROBES, version)
+        if similarity.ann is None:
+            logger.warning("RECOMMENDER_ANN_PROBES=%d but %s has no ANN index for this artifact; "
+                           "using exact scoring (run python ann.py build)", ANN_PROBES, artifact_dir)
+    with span('index_build'):
+        title_index = TitleIndex(catalog.titles)
+        facets = facets or FacetIndex(catalog)
+    return Recommender(catalog, similarity, title_index, facets, version)
+
+
+class RecommenderWatcher:
+    """The current Recommender, reloaded when a new artifact is published.
+
+    current() re-reads the artifact manifest at most every `check_interval`
+    seconds. Callers should fetch the recommender once per request and use
+    that object throughout, so one request never mixes two catalog versions.
+    """
+
+    def __init__(self, csv_path='movies.csv', artifact_dir=ARTIFACT_DIR, check_interval=5.0):
+        self.csv_path = csv_path
+        self.artifact_dir = artifact_dir
+        self.check_interval = check_interval
+        self.version = artifact_version(artifact_dir)
+        self.recommender = load_recommender(csv_path, artifact_dir)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def current(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._checked_at = time.monotonic()
+                    version = artifact_version(self.artifact_dir)
+                    # None means mid-swap or removed: keep serving what is loaded
+                    if version is not None and version != self.version:
+                        logger.info("Artifact changed (%s -> %s), reloading", self.version, version)
+                        previous = self.recommender
+                        self.recommender = load_recommender(self.csv_path, self.artifact_dir)
+                        self.version = version
+                        # Requests still holding the old recommender recompute; its results are not reused
+                        previous.query_cache.clear()
+                        previous.filter_cache.clear()
+        return self.recommender
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute recommendations for many seed lists.')
+    parser.add_argument('seeds', help='JSON lines with "user" and "seeds"')
+    parser.add_argument('output')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--csv', default='movies.csv')
+    parser.add_argument('--artifact', default=ARTIFACT_DIR)
+    args = parser.parse_args()
+
+    recommender = load_recommender(args.csv, args.artifact)
+    with open(args.seeds) as f:
+        users = [json.loads(line) for line in f if line.strip()]
+    results = recommender.recommend_batch([request['seeds'] for request in users], args.k)
+    with open(args.output, 'w') as f:
+        for request, ranked in zip(users, results):
+            recommendations = [{'title': title, 'score': round(score, 4)} for title, _, score in ranked]
+            f.write(json.dumps({'user': request.get('user'), 'recommendations': recommendations}) + '\n')
+    print(f"Wrote recommendations for {len(users)} users to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
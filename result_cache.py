@@ -0,0 +1,93 @@
+"""Bounded, single-flight cache for query results.
+
+Popular titles and filter combinations are asked for by many sessions at
+once. `ResultCache.get_or_compute()` serves repeats from an in-process LRU,
+and when several threads miss on the same key at the same time only the
+first computes; the rest wait for its result instead of repeating the work.
+
+Each Recommender owns its caches and puts its catalog version in every key,
+so a newly published artifact starts from empty caches and never serves
+results computed on the previous catalog.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from instrumentation import incr
+
+RESULT_CACHE_ENTRIES = int(os.environ.get('RECOMMENDER_RESULT_CACHE', '4096'))
+FILTER_CACHE_BYTES = int(float(os.environ.get('RECOMMENDER_FILTER_CACHE_MB', '64')) * 1024 * 1024)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """LRU of computed results, bounded by total weight (1 per entry unless `weigh` is given).
+
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, capacity=RESULT_CACHE_ENTRIES, weigh=None, name='result'):
+        self.capacity = capacity
+        self.weigh = weigh or (lambda value: 1)
+        self.name = name
+        self.weight = 0
+        self._entries = OrderedDict()  # key -> (value, weight)
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                incr(f'{self.name}_cache_hits')
+                return entry[0]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            incr(f'{self.name}_cache_coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        incr(f'{self.name}_cache_misses')
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e  # Waiters see the same error; nothing is cached
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None:
+                    self._store(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+
+    def _store(self, key, value):
+        weight = self.weigh(value)
+        if weight > self.capacity:
+            return  # Would evict everything else; serve it uncached
+        self._entries[key] = (value, weight)
+        self.weight += weight
+        while self.weight > self.capacity:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.weight -= evicted
+            incr(f'{self.name}_cache_evictions')
@@ -0,0 +1,271 @@
+"""Headless JSON HTTP recommendation service.
+
+    python service.py [--host 127.0.0.1] [--port 8000] [--csv movies.csv] [--artifact artifact]
+
+One long-lived process loads the catalog and its indexes once and serves
+requests on a thread per connection, reloading them when a new artifact
+is published. Endpoints:
+
+    GET  /health
+    GET  /metrics            Prometheus text format
+    GET  /recommend?q=<title>&k=10&field_weights=cast:2,tagline:0
+    POST /recommend          {"seeds": [...], "k": 10, "exclude": [...], "weights": [...],
+                              "field_weights": {"cast": 2.0, ...}}
+    POST /recommend/batch    {"seed_sets": [[...], ...], "k": 10}
+    GET  /facets
+    GET  /filter?genre=&director=&start_year=&end_year=&offset=0&limit=20
+    POST /details            {"titles": [...], "tmdb_ids": [...]}
+
+Malformed requests get a 400: k must be 1..RECOMMENDER_MAX_K, offset and
+limit must not be negative (limit at most RECOMMENDER_MAX_LIMIT), and
+weights and tmdb_ids need one entry per seed or title.
+
+The Streamlit app talks to it through RemoteRecommender when the
+RECOMMENDER_URL environment variable is set.
+"""
+import argparse
+import json
+import logging
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+import tmdb
+from artifact import ARTIFACT_DIR
+from instrumentation import log_trace, metrics, start_trace
+from recommender import RecommenderWatcher
+
+logger = logging.getLogger(__name__)
+
+
+MAX_K = int(os.environ.get('RECOMMENDER_MAX_K', '100'))  # Results per query; bounds cached result size
+MAX_LIMIT = int(os.environ.get('RECOMMENDER_MAX_LIMIT', '100'))  # Movies per /filter page
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _int(params, name, default, low=None, high=None):
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        raise BadRequest(f"{name} must be an integer")
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise BadRequest(f"{name} must be between {low} and {high}" if high is not None
+                         else f"{name} must be at least {low}")
+    return value
+
+
+def _list(body, name):
+    value = body.get(name, [])
+    if not isinstance(value, list):
+        raise BadRequest(f"{name} must be a list")
+    return value
+
+
+def _weights(body, seeds):
+    weights = body.get('weights')
+    if weights is None:
+        return None
+    if not isinstance(weights, list) or len(weights) != len(seeds):
+        raise BadRequest("weights must be a list with one number per seed")
+    if not all(isinstance(w, (int, float)) and not isinstance(w, bool) for w in weights):
+        raise BadRequest("weights must be numbers")
+    return weights
+
+
+def _field_weights(value):
+    # "cast:2,tagline:0" in query strings; a JSON object in request bodies
+    if not value:
+        return None
+    try:
+        if isinstance(value, dict):
+            return {str(field): float(weight) for field, weight in value.items()}
+        if isinstance(value, str):
+            return {field.strip(): float(weight) for field, weight in (pair.split(':') for pair in value.split(','))}
+    except (TypeError, ValueError):
+        pass
+    raise BadRequest("field_weights must look like field:weight,field:weight or {\"field\": weight}")
+
+
+def make_handler(current_recommender):
+    """Handler class for the routes; `current_recommender()` is called once per request."""
+    routes = {}
+
+    def route(method, path):
+        def register(func):
+            routes[(method, path)] = func
+            return func
+        return register
+
+    @route('GET', '/health')
+    def health(recommender, params, body):
+        return {'status': 'ok', 'movies': len(recommender.catalog)}
+
+    @route('GET', '/recommend')
+    def recommend_query(recommender, params, body):
+        if not params.get('q'):
+            raise BadRequest("q is required")
+        result = recommender.recommend_query(params['q'], _int(params, 'k', 10, 1, MAX_K),
+                                             _field_weights(params.get('field_weights')))
+        return result if result is not None else {'match': None, 'recommendations': []}
+
+    @route('POST', '/recommend')
+    def recommend(recommender, params, body):
+        seeds = _list(body, 'seeds')
+        ranked = recommender.recommend(
+            seeds, _int(body, 'k', 10, 1, MAX_K), _list(body, 'exclude'), _weights(body, seeds),
+            _field_weights(body.get('field_weights')),
+        )
+        return {'recommendations': [recommender.movie(row, similarity=score) for _, row, score in ranked]}
+
+    @route('POST', '/recommend/batch')
+    def recommend_batch(recommender, params, body):
+        seed_sets = _list(body, 'seed_sets')
+        if not all(isinstance(seeds, list) for seeds in seed_sets):
+            raise BadRequest("seed_sets must be a list of lists")
+        results = recommender.recommend_batch(seed_sets, _int(body, 'k', 10, 1, MAX_K))
+        return {'results': [[recommender.movie(row, similarity=score) for _, row, score in ranked]
+                            for ranked in results]}
+
+    @route('GET', '/facets')
+    def facets(recommender, params, body):
+        return recommender.facet_options()
+
+    @route('GET', '/filter')
+    def filter_movies(recommender, params, body):
+        year_range = None
+        if params.get('start_year') and params.get('end_year'):
+            year_range = (_int(params, 'start_year', 0), _int(params, 'end_year', 0))
+        return recommender.filter_movies(
+            params.get('genre') or None, params.get('director') or None, year_range,
+            _int(params, 'offset', 0, 0), _int(params, 'limit', 20, 0, MAX_LIMIT),
+        )
+
+    @route('POST', '/details')
+    def details(recommender, params, body):
+        titles, tmdb_ids = _list(body, 'titles'), body.get('tmdb_ids')
+        if tmdb_ids is not None and (not isinstance(tmdb_ids, list) or len(tmdb_ids) != len(titles)):
+            raise BadRequest("tmdb_ids must be a list with one entry per title")
+        return {'details': tmdb.fetch_many(titles, tmdb_ids=tmdb_ids)}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # Headers and body are separate writes; avoid delayed-ACK stalls
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+        def _dispatch(self, method):
+            # Read the body before any response, or its bytes would start the next request on a keep-alive connection
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                if length < 0:
+                    raise ValueError
+            except ValueError:
+                self.close_connection = True  # The body cannot be skipped without knowing where it ends
+                return self._send(400, {'error': 'invalid Content-Length'})
+            raw_body = self.rfile.read(length)
+            url = urlparse(self.path)
+            if method == 'GET' and url.path == '/metrics':
+                return self._send(200, metrics.prometheus_text(), 'text/plain; version=0.0.4')
+            trace = start_trace(f'{method} {url.path}')
+            handler = routes.get((method, url.path))
+            if handler is None:
+                return self._send(404, {'error': f"no route for {method} {url.path}"})
+            try:
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                body = json.loads(raw_body) if raw_body else {}
+                if not isinstance(body, dict):
+                    raise BadRequest("request body must be a JSON object")
+                self._send(200, handler(current_recommender(), params, body))
+            except (BadRequest, ValueError) as e:
+                self._send(400, {'error': str(e)})
+            except Exception:
+                logger.exception("Error handling %s %s", method, self.path)
+                self._send(500, {'error': 'internal error'})
+            finally:
+                log_trace(trace, logging.DEBUG)
+
+        def _send(self, status, payload, content_type='application/json'):
+            data = (payload if isinstance(payload, str) else json.dumps(payload)).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def make_server(recommender, host='127.0.0.1', port=8000):
+    """Serve a Recommender, or a RecommenderWatcher to pick up newly published artifacts."""
+    current = recommender.current if isinstance(recommender, RecommenderWatcher) else lambda: recommender
+    server = ThreadingHTTPServer((host, port), make_handler(current))
+    server.daemon_threads = True
+    return server
+
+
+class RemoteRecommender:
+    """Client for the service with the same query methods the app uses on Recommender."""
+
+    def __init__(self, base_url, timeout=(3.05, 10)):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _get(self, path, **params):
+        response = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path, body):
+        response = self.session.post(self.base_url + path, json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def recommend_query(self, query, k=10):
+        result = self._get('/recommend', q=query, k=k)
+        return result if result['match'] is not None else None
+
+    def facet_options(self):
+        return self._get('/facets')
+
+    def filter_movies(self, genre=None, director=None, year_range=None, offset=0, limit=20):
+        params = {'genre': genre or '', 'director': director or '', 'offset': offset, 'limit': limit}
+        if year_range:
+            params['start_year'], params['end_year'] = year_range
+        return self._get('/filter', **params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve recommendations over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--csv', default='movies.csv')
+    parser.add_argument('--artifact', default=ARTIFACT_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    watcher = RecommenderWatcher(args.csv, args.artifact)
+    server = make_server(watcher, args.host, args.port)
+    logger.info("Serving %d movies on http://%s:%d", len(watcher.current().catalog), args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
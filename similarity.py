@@ -0,0 +1,169 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+
+class SimilarityEngine:
+    """Top-k cosine similarity over a sparse, L2-normalized feature matrix.
+
+    Only the sparse matrix is kept in memory. Scores for a query row are
+    computed on demand with one sparse mat-vec, and an optional neighbour
+    table (int32 ids + float32 scores) can be precomputed for O(k) lookups.
+    """
+
+    def __init__(self, feature_vectors, neighbour_ids=None, neighbour_scores=None, normalized=False):
+        matrix = feature_vectors.tocsr().astype(np.float32, copy=False)
+        # Pass normalized=True for matrices that are already unit length (e.g. read-only memmaps)
+        self.matrix = matrix if normalized else normalize(matrix, norm='l2')
+        self.neighbour_ids = neighbour_ids
+        self.neighbour_scores = neighbour_scores
+        self.ann = None  # Optional ann.AnnIndex that replaces exact scoring when set
+        self.fields = None  # Optional features.FieldLayout; needed for per-request field weights
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def scores(self, index):
+        # Cosine similarity of one movie against every movie (rows are unit length)
+        row = self.matrix[index]
+        return (self.matrix @ row.T).toarray().ravel()
+
+    def top_k(self, index, k=10):
+        """Return the k most similar movies to `index` as (row, score) pairs, best first."""
+        if self.neighbour_ids is not None and k <= self.neighbour_ids.shape[1]:
+            ids = self.neighbour_ids[index, :k]
+            scores = self.neighbour_scores[index, :k]
+            return [(int(i), float(s)) for i, s in zip(ids, scores) if i >= 0]
+        if self.ann is not None:
+            return self.ann.search(self.matrix[index], k, exclude=[index])
+
+        scores = self.scores(index)
+        scores[index] = -np.inf  # Skip the input movie itself
+        ids = _top_k_ids(scores, k)
+        return [(int(i), float(scores[i])) for i in ids]
+
+    def recommend(self, seed_rows, k=10, exclude=(), weights=None, field_weights=None):
+        """Top-k (row, score) for a weighted profile of one or more seed rows, seeds excluded.
+
+        `field_weights` ({field: weight}) overrides the default per-field weights for this call only.
+        """
+        seed_rows = list(seed_rows)
+        if field_weights:
+            return self.recommend_weighted(seed_rows, k, exclude, weights, field_weights)
+        if len(seed_rows) == 1 and not len(exclude) and weights is None:
+            return self.top_k(seed_rows[0], k)
+        if self.ann is not None:
+            return self.ann.search(self.profile(seed_rows, weights), k, exclude=seed_rows + list(exclude))
+        return self.recommend_batch([seed_rows], k, [exclude], None if weights is None else [weights])[0]
+
+    def profile(self, seed_rows, weights=None):
+        """Unit-length weighted sum of the seed rows, as a sparse (1, terms) row."""
+        weights = np.ones(len(seed_rows), dtype=np.float32) if weights is None else np.asarray(weights, np.float32)
+        return normalize(csr_matrix(weights.reshape(1, -1)) @ self.matrix[seed_rows])
+
+    def recommend_weighted(self, seed_rows, k=10, exclude=(), weights=None, field_weights=None):
+        """recommend() under other field weights: the matrix is not copied, the query is rescaled.
+
+        The neighbour table only holds default-weight results, so this always scores; with an ANN
+        index only its candidates (found with default weights) are rescored.
+        """
+        if self.fields is None:
+            raise ValueError("field weights need a matrix built by features.FeaturePipeline")
+        ratios = self.fields.ratios(field_weights or {})
+        seed_rows = list(seed_rows)
+        weights = np.ones(len(seed_rows), dtype=np.float32) if weights is None else np.asarray(weights, np.float32)
+        # Seeds and profile live in the reweighted space; the query then carries the second sqrt(r)
+        seeds = normalize(self.fields.scale(self.matrix[seed_rows], np.sqrt(ratios)))
+        profile = normalize(csr_matrix(weights.reshape(1, -1)) @ seeds)
+        query = self.fields.scale(profile, np.sqrt(ratios))
+
+        rows = None
+        if self.ann is not None:
+            rows = self.ann.candidates(self.profile(seed_rows, weights))
+            scores = (self.matrix[rows] @ query.T).toarray().ravel()
+        else:
+            scores = (self.matrix @ query.T).toarray().ravel()
+        norms = self.fields.row_norms(ratios, rows)
+        scores = np.divide(scores, norms, out=np.zeros_like(scores), where=norms > 0)
+
+        skip = np.asarray(seed_rows + list(exclude), dtype=np.int64)
+        if rows is None:
+            scores[skip] = -np.inf
+        else:
+            scores[np.isin(rows, skip)] = -np.inf
+        ids = _top_k_ids(scores, k)
+        ids = ids[np.isfinite(scores[ids])]
+        found = ids if rows is None else rows[ids]
+        return [(int(row), float(scores[i])) for row, i in zip(found, ids)]
+
+    def recommend_batch(self, seed_sets, k=10, excludes=None, weights=None, batch_size=256):
+        """Score many seed sets at once: one sparse product per batch of profiles plus argpartition."""
+        n = len(self)
+        matrix_t = self.matrix.T.tocsc()
+        results = []
+        for start in range(0, len(seed_sets), batch_size):
+            chunk = seed_sets[start:start + batch_size]
+            rows, cols, values = [], [], []
+            for r, seeds in enumerate(chunk):
+                seed_weights = weights[start + r] if weights is not None else [1.0] * len(seeds)
+                for seed, weight in zip(seeds, seed_weights):
+                    rows.append(r)
+                    cols.append(seed)
+                    values.append(weight)
+            seed_matrix = csr_matrix((values, (rows, cols)), shape=(len(chunk), n), dtype=np.float32)
+            profiles = normalize(seed_matrix @ self.matrix)
+            block = (profiles @ matrix_t).toarray()
+
+            for r, seeds in enumerate(chunk):
+                block[r, list(seeds)] = -np.inf
+                if excludes is not None and len(excludes[start + r]):
+                    block[r, list(excludes[start + r])] = -np.inf
+
+            top = min(k, n)
+            if top <= 0:
+                results.extend([] for _ in chunk)
+                continue
+            ids = np.argpartition(-block, top - 1, axis=1)[:, :top]
+            scores = np.take_along_axis(block, ids, axis=1)
+            order = np.argsort(-scores, axis=1, kind='stable')
+            ids = np.take_along_axis(ids, order, axis=1)
+            scores = np.take_along_axis(scores, order, axis=1)
+            for row_ids, row_scores in zip(ids, scores):
+                results.append([(int(i), float(s)) for i, s in zip(row_ids, row_scores) if np.isfinite(s)])
+        return results
+
+    def build_neighbours(self, k=50, batch_size=256):
+        """Precompute the top-k neighbour table, scoring `batch_size` rows at a time."""
+        n = len(self)
+        k = min(k, n - 1)
+        self.neighbour_ids, self.neighbour_scores = self.neighbours_for(np.arange(n), k, batch_size)
+        return self.neighbour_ids, self.neighbour_scores
+
+    def neighbours_for(self, rows, k, batch_size=256):
+        """Exact top-k (ids, scores) for the given rows, excluding each row itself."""
+        rows = np.asarray(rows, dtype=np.int64)
+        neighbour_ids = np.full((len(rows), k), -1, dtype=np.int32)
+        neighbour_scores = np.zeros((len(rows), k), dtype=np.float32)
+        matrix_t = self.matrix.T.tocsc()
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            block = (self.matrix[batch] @ matrix_t).toarray()
+            block[np.arange(len(batch)), batch] = -np.inf
+            for offset, row_scores in enumerate(block):
+                ids = _top_k_ids(row_scores, k)
+                ids = ids[np.isfinite(row_scores[ids])]
+                neighbour_ids[start + offset, :len(ids)] = ids
+                neighbour_scores[start + offset, :len(ids)] = row_scores[ids]
+        return neighbour_ids, neighbour_scores
+
+
+def _top_k_ids(scores, k):
+    # argpartition picks the top k in O(N); only those k are then sorted.
+    # Ties are broken by row order, matching a stable sort of the full row.
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int32)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order].astype(np.int32)
@@ -0,0 +1,80 @@
+import difflib
+from collections import defaultdict
+
+import numpy as np
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Fuzzy title lookup without scanning every title.
+
+    Exact and case-insensitive matches are a hash lookup. Otherwise a trigram
+    inverted index picks a shortlist of titles sharing the most trigrams with
+    the query, and only that shortlist is scored with difflib.
+    """
+
+    def __init__(self, titles, shortlist_size=50):
+        # `titles` is any sequence of strings (e.g. Catalog.titles); it is referenced, not copied
+        self.titles = titles
+        self.shortlist_size = shortlist_size
+        self.lower = {}  # hash of the lowercased title -> first row, checked against the title on lookup
+        postings = defaultdict(list)
+        gram_counts = np.zeros(len(titles), dtype=np.int32)
+        for row, title in enumerate(titles):
+            lowered = title.lower()
+            self.lower.setdefault(hash(lowered), row)
+            grams = _trigrams(lowered)
+            gram_counts[row] = len(grams)
+            for gram in grams:
+                postings[gram].append(row)
+        self.postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+        self.gram_counts = gram_counts
+
+    def lookup(self, query, n=3, cutoff=0.6):
+        """Return up to n (title, row, score) candidates, best first, like difflib.get_close_matches."""
+        query = str(query).strip()
+        if not query:
+            return []
+        row = self.exact(query)
+        if row is not None:
+            return [(self.titles[row], row, 1.0)]
+
+        lowered = query.lower()
+        shortlist = self._shortlist(lowered)
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(lowered)
+        scored = []
+        for row in shortlist:
+            matcher.set_seq1(self.titles[row].lower())
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                score = matcher.ratio()
+                if score >= cutoff:
+                    scored.append((score, row))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [(self.titles[int(row)], int(row), score) for score, row in scored[:n]]
+
+    def exact(self, title):
+        """Row of the first title equal to `title` ignoring case and surrounding space, or None."""
+        lowered = str(title).strip().lower()
+        row = self.lower.get(hash(lowered))
+        if row is not None and self.titles[row].lower() == lowered:
+            return row
+        return None
+
+    def _shortlist(self, lowered):
+        # Rank titles by Dice overlap of trigram sets and keep the best few
+        grams = _trigrams(lowered)
+        rows = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not rows:
+            return []
+        counts = np.bincount(np.concatenate(rows), minlength=len(self.titles))
+        candidates = np.flatnonzero(counts)
+        dice = 2.0 * counts[candidates] / (self.gram_counts[candidates] + len(grams))
+        if len(candidates) > self.shortlist_size:
+            top = np.argpartition(-dice, self.shortlist_size - 1)[:self.shortlist_size]
+            candidates = candidates[top]
+        return candidates
@@ -0,0 +1,272 @@
+"""TMDB metadata lookups (poster, release date, trailer, rating).
+
+A lookup is one request: details with the videos appended, by TMDB id. The
+id comes from the catalog (the CSV's id column) when known; otherwise one
+search resolves it and the mapping is kept in the metadata cache database.
+
+All calls go through one shared `requests.Session`, so keep-alive
+connections are reused across lookups, and `fetch_many()` runs lookups on
+one process-wide pool of TMDB_MAX_WORKERS threads so a page of cards costs
+roughly one round trip of latency instead of one per movie. Concurrent
+sessions and requests share that pool, so the limit (and the connection
+pool sized to it) holds per process, not per call. Results (including "no match") are
+cached in a two-tier TTL cache, see metadata_cache.py. Titles already
+prefetched into the local metadata store (prefetch.py) never hit TMDB.
+
+Requests are rate-limited, retried with backoff and guarded by a circuit
+breaker (tmdb_client.py). While TMDB is failing, lookups return at once
+with expired cached details when there are any, else None (placeholder).
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import incr, map_in_context, span, submit_in_context
+from metadata_cache import MISSING, MetadataCache, details_key
+from metadata_store import STORE_DIR, load_lookup
+from poster_cache import PosterCache
+from tmdb_client import CircuitOpen, ResilientClient
+
+TMDB_API_KEY = os.environ.get('TMDB_API_KEY', '711e04f6f9c64b4b56a9fdd452624371')
+BASE_URL = os.environ.get('TMDB_BASE_URL', 'https://api.themoviedb.org/3')
+MAX_WORKERS = int(os.environ.get('TMDB_MAX_WORKERS', '8'))
+REQUEST_TIMEOUT = (3.05, 10)  # (connect, read) seconds per request
+CACHE_PATH = os.environ.get('TMDB_CACHE_PATH', 'tmdb_cache.sqlite3')
+RATE_LIMIT = float(os.environ.get('TMDB_RATE_LIMIT', '40'))  # Requests per second per process
+MAX_RETRIES = int(os.environ.get('TMDB_MAX_RETRIES', '2'))
+BREAKER_FAILURES = int(os.environ.get('TMDB_BREAKER_FAILURES', '5'))
+BREAKER_RESET = float(os.environ.get('TMDB_BREAKER_RESET', '30'))  # Seconds before a trial request
+PLACEHOLDER_POSTER = "https://via.placeholder.com/500x750?text=No+Poster+Available"
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+_store = None
+_store_lock = threading.Lock()
+_client = None
+_client_lock = threading.Lock()
+_posters = None
+_posters_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide session, sized so every worker thread gets a pooled connection."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def get_client():
+    """Return the process-wide rate limiter, retry policy and circuit breaker."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ResilientClient(rate=RATE_LIMIT, burst=max(MAX_WORKERS, 10), max_retries=MAX_RETRIES,
+                                      failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET)
+        return _client
+
+
+def get_executor():
+    """Return the process-wide lookup pool; every fetch_many() and fetch_as_completed() call shares it."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='tmdb')
+        return _executor
+
+
+def get_posters():
+    """Return the process-wide poster thumbnail cache (created on first use)."""
+    global _posters
+    with _posters_lock:
+        if _posters is None:
+            _posters = PosterCache()
+        return _posters
+
+
+def get_cache():
+    """Return the process-wide metadata cache (created on first use)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MetadataCache(CACHE_PATH)
+        return _cache
+
+
+def get_store():
+    """Return the prefetched {details_key: details} lookup (loaded on first use)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = load_lookup(STORE_DIR)
+        return _store
+
+
+def _cached(title, tmdb_id=None):
+    key = details_key(title, tmdb_id)
+    store = get_store()
+    if key in store:
+        incr('metadata_store_hits')
+        return store[key]
+    return get_cache().get(title, tmdb_id)
+
+
+def _get_json(session, path, timeout, **params):
+    with span('tmdb_request'):
+        return get_client().get_json(session, f'{BASE_URL}{path}', {'api_key': TMDB_API_KEY, **params}, timeout)
+
+
+def fetch_movie_details(title, session=None, timeout=REQUEST_TIMEOUT, tmdb_id=None):
+    """Fetch poster, release date, trailer and rating for one title, or None if not found.
+
+    The director is not included; callers take it from the catalog.
+    """
+    cached = _cached(title, tmdb_id)
+    if cached is not MISSING:
+        return cached
+    return _fetch_and_cache(title, session or get_session(), timeout, tmdb_id)
+
+
+def _fetch_and_cache(title, session, timeout, tmdb_id=None):
+    try:
+        details = lookup_movie(title, session, timeout, tmdb_id)
+    except requests.exceptions.RequestException as e:
+        # Errors are not cached, so the next rerun retries; meanwhile serve stale details if we have them
+        incr('tmdb_errors')
+        if not isinstance(e, CircuitOpen):
+            logger.warning("Error fetching movie details for %r: %s", title, e)
+        stale = get_cache().get_stale(title, tmdb_id)
+        return stale if stale is not MISSING else None
+    get_cache().set(title, details, tmdb_id)
+    return details
+
+
+def lookup_movie(title, session, timeout=REQUEST_TIMEOUT, tmdb_id=None):
+    """Uncached TMDB lookup; returns None for no match and raises on request errors."""
+    from_catalog = tmdb_id is not None
+    if not from_catalog:
+        tmdb_id = resolve_id(title, session, timeout)
+        if tmdb_id is None:
+            return None
+
+    # Details and videos in one request
+    try:
+        details_data = _get_json(session, f'/movie/{tmdb_id}', timeout, append_to_response='videos')
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 404:
+            raise
+        if from_catalog:
+            # TMDB no longer has the catalog's id: look the title up by search instead
+            return lookup_movie(title, session, timeout)
+        return None  # A no-match, cached like an empty search
+
+    poster_path = details_data.get('poster_path', '')
+    poster_url = f"https://image.tmdb.org/t/p/w500{poster_path}" if poster_path else PLACEHOLDER_POSTER
+
+    # Extract YouTube trailer key
+    trailer_key = None
+    for video in details_data.get('videos', {}).get('results', []):
+        if video['type'] == 'Trailer' and video['site'] == 'YouTube':
+            trailer_key = video['key']
+            break
+
+    trailer_url = f"https://www.youtube.com/embed/{trailer_key}" if trailer_key else None
+
+    return {
+        'title': details_data.get('title', title),
+        'poster': poster_url,
+        'release_date': details_data.get('release_date', ''),
+        'trailer': trailer_url,
+        'rating': details_data.get('vote_average', 0)
+    }
+
+
+def resolve_id(title, session, timeout=REQUEST_TIMEOUT):
+    """TMDB id for a title without one in the catalog: the stored mapping, else one search."""
+    cache = get_cache()
+    tmdb_id = cache.get_id(title)
+    if tmdb_id is None:
+        search_data = _get_json(session, '/search/movie', timeout, query=title)
+        if not search_data['results']:
+            return None  # The negative result is cached with the details
+        tmdb_id = search_data['results'][0]['id']
+        cache.set_id(title, tmdb_id)
+    return tmdb_id
+
+
+def fetch_many(titles, timeout=REQUEST_TIMEOUT, tmdb_ids=None):
+    """Fetch details for many titles concurrently; results are in input order (None for misses).
+
+    `tmdb_ids`, parallel to `titles`, skips the search for titles whose id is known (None otherwise).
+    """
+    with span('tmdb_fetch_many'):
+        ids = tmdb_ids or [None] * len(titles)
+        results = [_cached(title, tmdb_id) for title, tmdb_id in zip(titles, ids)]
+        pending = [i for i, result in enumerate(results) if result is MISSING]
+        if not pending:
+            return results
+
+        session = get_session()
+
+        def fetch(i):
+            return _fetch_and_cache(titles[i], session, timeout, ids[i])
+
+        for i, details in zip(pending, map_in_context(get_executor(), fetch, pending)):
+            results[i] = details
+        return results
+
+
+def fetch_as_completed(titles, timeout=REQUEST_TIMEOUT, tmdb_ids=None, thumbnail_width=None):
+    """Yield (index, details) for every title: cached ones at once, the rest as their lookups finish.
+
+    Lets a page draw every card first and fill each one in as soon as its details arrive. With
+    `thumbnail_width`, details also carry 'thumbnail', the path of a local poster thumbnail (or None).
+    """
+    posters = get_posters() if thumbnail_width else None
+    ids = tmdb_ids or [None] * len(titles)
+    pending = []
+    for i, title in enumerate(titles):
+        cached = _cached(title, ids[i])
+        if cached is not MISSING and posters is not None and cached:
+            thumbnail = posters.cached(cached['poster'], thumbnail_width)
+            cached = {**cached, 'thumbnail': thumbnail} if thumbnail else MISSING
+        if cached is MISSING:
+            pending.append(i)
+        else:
+            yield i, cached
+    if not pending:
+        return
+
+    session = get_session()
+
+    def fetch(i):
+        details = fetch_movie_details(titles[i], session, timeout, ids[i])
+        if details and posters is not None:
+            # A copy: the cached dict is shared and stays free of local paths
+            details = {**details, 'thumbnail': posters.thumbnail(details['poster'], thumbnail_width, session)}
+        return details
+
+    executor = get_executor()
+    futures = {submit_in_context(executor, fetch, i): i for i in pending}
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # A rerun abandons this generator: drop its queued lookups so they do not hold up other sessions
+        for future in futures:
+            future.cancel()
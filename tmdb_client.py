@@ -0,0 +1,167 @@
+"""Rate-limited, retrying HTTP transport for TMDB with a circuit breaker.
+
+`ResilientClient.get_json()` wraps one GET with:
+
+- a token bucket shared by every thread, so bursts stay under TMDB's limit
+- connect/read timeouts on every attempt
+- retries with jittered exponential backoff on timeouts, connection errors,
+  5xx and 429, honouring Retry-After (a wait longer than `max_retry_after`
+  is not worth holding a page for, so that raises instead)
+- a circuit breaker: after `failure_threshold` consecutive failed attempts
+  calls raise CircuitOpen immediately for `reset_timeout` seconds, then one
+  trial call decides whether to close it again
+
+Every error raised is a requests RequestException, so callers keep a
+single except clause and fall back to cached or placeholder metadata.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from instrumentation import incr
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """Raised without a request while the breaker is open."""
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average and bursts of up to `burst`, across threads."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now, even if that drives the balance negative, and sleep off the debt
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open after a cool-down -> closed on success."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half-open'
+            if self.state == 'half-open' and not self._trial_running:
+                self._trial_running = True  # Exactly one trial call; the rest keep failing fast
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("TMDB circuit closed")
+            self.state = 'closed'
+            self._failures = 0
+            self._trial_running = False
+
+    def release(self):
+        # A trial that ended without an outcome must not keep the breaker half-open forever
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == 'half-open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning("TMDB circuit opened after %d failures", self._failures)
+                    incr('tmdb_circuit_opened')
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+class ResilientClient:
+    """Retry, rate-limit and circuit-breaker policy around a requests session."""
+
+    def __init__(self, rate=40.0, burst=20, max_retries=2, backoff_base=0.25, backoff_cap=2.0,
+                 max_retry_after=5.0, failure_threshold=5, reset_timeout=30.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+
+    def get_json(self, session, url, params, timeout):
+        """GET `url` and return the decoded JSON body; raises a RequestException on failure."""
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                incr('tmdb_circuit_rejected')
+                raise CircuitOpen(f"TMDB circuit is open, not requesting {url}")
+            self.bucket.acquire()
+            incr('tmdb_requests')
+            delay = None
+            try:
+                try:
+                    response = session.get(url, params=params, timeout=timeout)
+                except requests.exceptions.RequestException as e:
+                    # Timeouts, refused connections, broken chunked bodies, redirect loops...
+                    self.breaker.record_failure()
+                    error = e
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        self.breaker.record_success()  # A 404 is still a healthy TMDB
+                        response.raise_for_status()
+                        return response.json()
+                    if response.status_code == 429:
+                        incr('tmdb_throttled')
+                        self.breaker.record_success()  # Throttling is handled by backing off, not by the breaker
+                    else:
+                        self.breaker.record_failure()
+                    delay = _retry_after(response)
+                    error = requests.exceptions.HTTPError(f"{response.status_code} from {url}", response=response)
+                    if delay is not None and delay > self.max_retry_after:
+                        raise error
+            finally:
+                self.breaker.release()
+
+            if attempt == self.max_retries:
+                raise error
+            if delay is None:
+                # Full jitter keeps many workers from retrying in lock step
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            incr('tmdb_retries')
+            time.sleep(delay)
+
+
+def _retry_after(response):
+    # Only the delta-seconds form; TMDB does not send HTTP dates here
+    value = response.headers.get('Retry-After')
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None